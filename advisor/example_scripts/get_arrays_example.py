@@ -30,6 +30,13 @@ ai = adv1.get_array('ai',include_children=True,filterVal=['current_deposition.F9
 gflops = adv1.get_array('gflops',include_children=True,filterVal=['current_deposition.F90',[2681,2730,9552]],filterKey=['file','line'],filterOp=[op1,op2])
 times = adv1.get_array('selftime',include_children=True,filterVal=['current_deposition.F90',[2681,2730,9552]],filterKey=['file','line'],filterOp=[op1,op2])
 
+# The same arrays can be obtained with a condition, evaluated on whole columns at once
+
+rows = adv1.where(file='current_deposition.F90',line__in=[2681,2730,9552])
+ai = adv1.get_values('ai',rows)
+gflops = adv1.get_values('gflops',rows)
+times = adv1.get_values('selftime',rows)
+
 # 3) Plot of the data
 
 fig = pl.figure(1)
@@ -43,4 +43,10 @@ def op2(val_from_loop,val_filter):
 
 adv1.print_loop_properties(include_children=True,has_data=True,filterVal=['current_deposition.F90',[2681,2730,9552]],filterKey=['file','line'],filterOp=[op1,op2])
 
-# Filters can be added like this indefinitely, it's cool isn't it !?     
+# Filters can be added like this indefinitely, it's cool isn't it !?
+
+# 6) Print the loops of current_deposition.F90 as a Markdown table (fmt can also be 'csv'),
+# output can also be a file name, e.g. output='current_deposition.md', or output='pager' for a pager
+
+adv1.print_loop_properties(include_children=True,has_data=True,where=advisor.condition(file='current_deposition.F90'),
+                           fmt='markdown')
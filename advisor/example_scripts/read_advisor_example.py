@@ -25,31 +25,14 @@ pl.legend(loc=2)
 fig.colorbar(sc1)
 
 
-# Do not be afraid, this part is only here to add some more interactivity with python 3
-for loop in adv1.loops:
-    if loop.has_data():
-        for loop2 in adv2.loops:
-            if loop.functioncallsitesandloops in loop2.functioncallsitesandloops and loop2.has_data():
-                # print(loop.functioncallsitesandloops+' ' +  loop.gflops)
-                # print(loop2.functioncallsitesandloops+' ' +  loop2.gflops)
-
-                x = [float(loop.ai),    float(loop2.ai)]
-                y = [float(loop.gflops),float(loop2.gflops)]
-                pl.plot(x,y,'k--')
-    # Check if the loop has a child with data
-    elif loop.child_has_data():
-        # Loop through loops in 2nd set and look for matching label
-        for loop2 in adv2.loops:
-            if loop.functioncallsitesandloops in loop2.functioncallsitesandloops:
-                # Look for the child with the data in the 1st set
-                for i,child in enumerate(loop.children):
-                    if len(loop2.children) > i and child.has_data() and loop2.children[i].has_data():
-                        # Assume that the children have the same order in the 2nd set
-                        #print('child '+str(i)+ ' of '+loop.functioncallsitesandloops+
-                        #      ' ' +  child.gflops + ' ' + loop2.children[i].gflops)
-                        x = [float(child.ai),    float(loop2.children[i].ai)]
-                        y = [float(child.gflops),float(loop2.children[i].gflops)]
-                        pl.plot(x,y,'k--')
+# Join the loops found in both reports that have data in both
+diff = advisor.diff(adv1,adv2,keys=['ai','gflops'])
+
+for i in range(len(diff.rows1)):
+    if diff.has_data[i]:
+        x = [diff.values1['ai'][i],    diff.values2['ai'][i]]
+        y = [diff.values1['gflops'][i],diff.values2['gflops'][i]]
+        pl.plot(x,y,'k--')
 
 pl.show()                        
                 
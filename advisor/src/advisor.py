@@ -14,175 +14,1919 @@
  ___________________________________________________________________
 """
 
+import collections.abc
 import csv
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
 import numpy as np
-import pylab as pl
-import matplotlib.pyplot as plt
+
+# matplotlib is only imported by the plotting methods, see import_pyplot
+
+# Version of the binary cache format, caches with another version are ignored
+cache_version = 3
+
+# Parsed roofs files per machine profile or file, see load_roofs
+roofs_cache = dict()
+
+# Names of the ceilings in roofs files
+roof_name = re.compile(r'^[A-Za-z][A-Za-z0-9 ()+/.-]*$')
+
+# Numbers accepted by float() in Advisor cells, see convert_to_float
+# (digits with an optional fraction, or a fraction alone, and an optional exponent)
+number = re.compile(r'^\s*[-+]?(?:(?:\d+(?:_\d+)*(?:\.(?:\d+(?:_\d+)*)?)?|\.\d+(?:_\d+)*)(?:[eE][-+]?\d+(?:_\d+)*)?|nan|inf|infinity)\s*$',re.IGNORECASE)
+
+# Type of the cells of the columns, by formatted key, used for their float values (see convert_cell) and by
+# column_store.get_typed. Other columns are numbers.
+#  time       : seconds, e.g. '0.6199s'
+#  multiplier : e.g. '9.63x'
+#  percent    : e.g. '48.2%' or '48.2'
+#  pair       : value of the loop body and of the remainder/peeled loops, e.g. '8; [8]'
+#  list       : items separated by ';', remainder items in brackets and <b></b> markup, e.g. '<b>Float64</b>; [Int32]'
+column_types = {'selftime':'time','elapsedtime':'time','totaltime':'time','tripcountsiterationduration':'time',
+                'gainestimate':'multiplier','compilerestimatedgain':'multiplier',
+                'maskutilization':'percent','efficiency':'percent',
+                'vlvectorlength':'pair','unrollfactor':'pair','multi-pumpingfactor':'pair',
+                'vectorisa':'list','vectorizedloops':'list','datatypes':'list','traits':'list','instructionsets':'list',
+                'instructionsetanalysis':'list','transformations':'list','vectorizationdetails':'list',
+                'optimizationdetails':'list','advanced':'list','vectorwidths':'list'}
+
+# OpenMP region of the functions outlined by the compiler, e.g. 'push_$omp$parallel_for@55', see parse_location
+omp_region = re.compile(r'\$omp\$(\w+@\d+)')
+
+# Line of the preamble with the MPI rank of a report
+rank_line = re.compile(r'MPI rank\s*:\s*(\d+)')
+
+# Html markup and bracketed parts of the cells, see parse_cell
+markup = re.compile(r'</?[A-Za-z]+>')
+brackets = re.compile(r'\[([^\]]*)\]')
+
+# Instrumentation recording the stages, None when not instrumenting, see instrumentation
+active_instrumentation = None
+
+# Flags of the typed cells, see column_store.get_typed
+flag_empty = 1       # empty cell
+flag_na = 2          # 'n/a'
+flag_bound = 4       # upper bound, e.g. '< 0.0001', the value is the bound
+flag_remainder = 8   # the cell has a remainder part in brackets
+flag_markup = 16     # the cell had html markup
+flag_invalid = 32    # the cell could not be parsed
+
+# ___________________________________________________________________
+#
+# Instrumentation
+# ___________________________________________________________________
+
+class instrumentation():
+    """
+    This is a class for the opt-in instrumentation of pyAdvisor itself. While it is active, the stages of
+    the constructor, get_array, plot and print_loop_properties record their number of calls, wall time,
+    the rows they handle, the memory blocks they leave allocated and whether they raised. With memory=True,
+    the bytes allocated and the peak memory of each stage are measured with tracemalloc, which slows the
+    stages down. Stages are named by their path, e.g. 'advisor_results/parse/finalize', and counters
+    record events such as cells that can't be converted to numbers.
+
+    Example: with advisor.instrumentation(memory=True,trace='load.json') as prof:
+                 adv = advisor.advisor_results(fn)
+             print(prof.summary())
+
+    Nothing is recorded and the stages cost a single test when no instrumentation is active.
+    """
+
+    def __init__(self,memory=False,trace=None):
+        """
+        Input:
+        -------------
+        memory : if True, measure the allocated bytes and the peak memory of the stages with tracemalloc
+        trace  : file of the trace written when the instrumentation stops, in the Chrome trace event format
+                 (chrome://tracing or https://ui.perfetto.dev), None for no trace file
+        -------------
+        """
+
+        self.memory = memory
+        self.trace = trace
+
+        # path -> dictionary with 'calls', 'seconds', 'self_seconds', 'rows', 'blocks', 'errors' and,
+        # with memory, 'allocated' and 'peak' (bytes)
+        self.stages = dict()
+        # name -> count
+        self.counters = dict()
+        # Maximum resident memory of the process in bytes, when the instrumentation stopped
+        self.max_rss = None
+
+        self.events = list()
+        self._stacks = dict()
+        self._lock = threading.Lock()
+        self._tracemalloc = False
+        self._origin = time.perf_counter()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*exc):
+        self.stop()
+
+    def start(self):
+        """
+        Start recording, replacing the active instrumentation if any
+        """
+
+        global active_instrumentation
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc = True
+        active_instrumentation = self
+        return self
+
+    def stop(self):
+        """
+        Stop recording and write the trace file
+        """
+
+        global active_instrumentation
+
+        if active_instrumentation is self:
+            active_instrumentation = None
+        if self._tracemalloc:
+            tracemalloc.stop()
+            self._tracemalloc = False
+
+        self.max_rss = max_rss()
+        if not self.trace is None:
+            self.write_trace(self.trace)
+        return self
+
+    def begin(self,name):
+        """
+        Start a stage nested in the current stage of the thread, return its frame for end
+        """
+
+        stack = self._stacks.setdefault(threading.get_ident(),list())
+        path = stack[-1]['path'] + '/' + name if len(stack) > 0 else name
+        frame = {'path':path,'rows':None,'children':0.0,'blocks':sys.getallocatedblocks()}
+
+        # Stages are kept in the order they first started, each stage before the stages nested in it
+        with self._lock:
+            if not path in self.stages:
+                self.stages[path] = {'calls':0,'seconds':0.0,'self_seconds':0.0,'rows':0,'blocks':0,'errors':0}
+
+        if self.memory and tracemalloc.is_tracing():
+            current,peak = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                stack[-1]['peak'] = max(stack[-1]['peak'],peak)
+            tracemalloc.reset_peak()
+            frame['current'] = current
+            frame['peak'] = current
+
+        stack.append(frame)
+        frame['start'] = time.perf_counter()
+        return frame
+
+    def end(self,frame,error=False):
+        """
+        End the stage of frame and record it
+        """
+
+        stop = time.perf_counter()
+        seconds = stop - frame['start']
+
+        stack = self._stacks[threading.get_ident()]
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1]['children'] += seconds
+
+        allocated = None
+        if 'current' in frame and tracemalloc.is_tracing():
+            current,peak = tracemalloc.get_traced_memory()
+            frame['peak'] = max(frame['peak'],peak)
+            if len(stack) > 0 and 'peak' in stack[-1]:
+                stack[-1]['peak'] = max(stack[-1]['peak'],frame['peak'])
+            allocated = current - frame['current']
+
+        with self._lock:
+            stage = self.stages[frame['path']]
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['self_seconds'] += seconds - frame['children']
+            stage['rows'] += frame['rows'] or 0
+            stage['blocks'] += sys.getallocatedblocks() - frame['blocks']
+            stage['errors'] += int(error)
+            if allocated is not None:
+                stage['allocated'] = stage.get('allocated',0) + allocated
+                stage['peak'] = max(stage.get('peak',0),frame['peak'] - frame['current'])
+
+            if not self.trace is None:
+                self.events.append({'name':frame['path'].rpartition('/')[2],'cat':'pyadvisor','ph':'X',
+                                    'ts':1e6 * (frame['start'] - self._origin),'dur':1e6 * seconds,
+                                    'pid':os.getpid(),'tid':threading.get_ident(),
+                                    'args':{'path':frame['path'],'rows':frame['rows']}})
+
+    def rows(self,n):
+        """
+        Add n to the rows handled by the current stage of the thread
+        """
+        stack = self._stacks.get(threading.get_ident())
+        if stack:
+            stack[-1]['rows'] = (stack[-1]['rows'] or 0) + n
+
+    def count(self,name,n=1):
+        """
+        Add n to the counter name
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name,0) + n
+
+    def to_dict(self):
+        """
+        Return the stages, the counters and the maximum resident memory as a dictionary that json can write
+        """
+        return {'stages':self.stages,'counters':self.counters,'max_rss':self.max_rss}
+
+    def summary(self):
+        """
+        Return a table of the stages, nested stages being indented below their parent, and of the counters
+        """
+
+        memory = any('allocated' in stage for stage in self.stages.values())
+        lines = [' {0:48} {1:>7} {2:>10} {3:>10} {4:>10} {5:>10}'.format('Stage','Calls','Seconds','Self','Rows','Blocks')
+                 + (' {0:>14} {1:>14}'.format('Allocated','Peak') if memory else '')]
+        for path,stage in self.stages.items():
+            name = '  ' * path.count('/') + path.rpartition('/')[2] + (' ({0} errors)'.format(stage['errors'])
+                                                                      if stage['errors'] > 0 else '')
+            line = ' {0:48} {1:7d} {2:10.4f} {3:10.4f} {4:10d} {5:10d}'.format(
+                name,stage['calls'],stage['seconds'],stage['self_seconds'],stage['rows'],stage['blocks'])
+            if memory:
+                line += ' {0:>14} {1:>14}'.format(stage.get('allocated','-'),stage.get('peak','-'))
+            lines.append(line)
+
+        if len(self.counters) > 0:
+            lines.append('')
+            for name in sorted(self.counters):
+                lines.append(' {0:48} {1:10d}'.format(name,self.counters[name]))
+
+        if not self.max_rss is None:
+            lines.append('')
+            lines.append(' {0:48} {1:10d}'.format('Maximum resident memory (bytes)',self.max_rss))
+
+        return '\n'.join(lines)
+
+    def write_trace(self,fn):
+        """
+        Write the stages recorded so far as complete events of the Chrome trace event format
+        """
+
+        with open(fn,mode='w') as fh:
+            json.dump({'traceEvents':self.events,'displayTimeUnit':'ms','otherData':self.to_dict()},fh)
+
+class instrument_stage():
+    """
+    Context manager recording a stage in the active instrumentation, if any
+    """
+
+    __slots__ = ['name','prof','frame']
+
+    def __init__(self,name):
+        self.name = name
+        self.prof = None
+        self.frame = None
+
+    def __enter__(self):
+        self.prof = active_instrumentation
+        if not self.prof is None:
+            self.frame = self.prof.begin(self.name)
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        if not self.frame is None:
+            self.prof.end(self.frame,error=not exc_type is None)
+
+def instrumented(name):
+    """
+    Decorator recording each call of a function as the stage name of the active instrumentation
+    """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if active_instrumentation is None:
+                return func(*args,**kwargs)
+            with instrument_stage(name):
+                return func(*args,**kwargs)
+        return wrapper
+
+    return decorate
+
+def instrument_rows(n):
+    """
+    Add n to the rows of the current stage of the active instrumentation
+    """
+    if not active_instrumentation is None:
+        active_instrumentation.rows(n)
+
+def instrument_count(name,n=1):
+    """
+    Add n to the counter name of the active instrumentation
+    """
+    if not active_instrumentation is None:
+        active_instrumentation.count(name,n)
+
+def max_rss():
+    """
+    Return the maximum resident memory of the process in bytes, or None if it is not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
 
 class roofs():
+    """
+    This is a class for the roofs (bandwidth and compute ceilings) of a machine measured by Intel Advisor.
+    Both the single-threaded and the multi-threaded ceilings are kept in the ceilings - field as dictionaries
+    formatted name -> GB/s or GFLOPS. The ceilings selected with single are also set as attributes, e.g.
+    roofs.drambandwidth or roofs.dpvectorfmapeak.
+    """
+
+    def __init__(self,fn='roofs.dat',single=False,ceilings=None):
+        """
+        Input:
+        -------------
+        fn       : roofs file, or Advisor export containing the roofs
+        single   : if True, the attributes are the single-threaded ceilings
+        ceilings : already parsed ceilings (see read_roofs), the file is not read if given
+        -------------
+        """
+
+        self.filename = fn
+        self.single = single
+
+        #Read in Roofs    
+        if ceilings is None:
+            ceilings = read_roofs(fn)
+        self.ceilings = ceilings
+
+        for key,val in self.ceilings['single' if single else 'multi'].items():
+            setattr(self,key,val)
+
+    def model(self,single=None):
+        """
+        Return the roofline_model of the single-threaded or multi-threaded ceilings (default: as in the constructor)
+        """
+        if single is None:
+            single = self.single
+        return roofline_model.from_ceilings(self.ceilings['single' if single else 'multi'])
+
+    def plot(self,ax=None):
+
+        if ax is None:
+            ax = import_pyplot().gca()
+        
+        xlim = np.array(ax.get_xlim())
+        ylim = np.array(ax.get_ylim())
+
+        x = np.logspace(np.log10(xlim[0]),np.log10(xlim[1]),1000)
+
+        model = roofline_model.from_roofs(self)
+        y = model.curves(x,bandwidths=['drambandwidth','l2bandwidth','l1bandwidth'],
+                         peaks=['scalaraddpeak','dpvectoraddpeak','dpvectorfmapeak'])
+        ax.plot(x,y.T,color='k',ls='-',lw='2')
+
+def load_roofs(fn='roofs.dat',single=False,profile=None):
+    """
+    Return a roofs object for fn, parsing each file only once. With a machine profile name (e.g. the node
+    type), the ceilings parsed for that profile are reused for any file without reading it again. Without
+    a profile, the file is parsed again only if its size or modification time changes.
+    """
+
+    if not profile is None and profile in roofs_cache:
+        return roofs(fn,single=single,ceilings=roofs_cache[profile][1])
+
+    stat = os.stat(fn)
+    signature = (stat.st_size,stat.st_mtime)
+    key = os.path.realpath(fn) if profile is None else profile
+
+    cached = roofs_cache.get(key)
+    if cached is None or cached[0] != signature:
+        cached = (signature,read_roofs(fn))
+        roofs_cache[key] = cached
+
+    return roofs(fn,single=single,ceilings=cached[1])
+
+class roofline_model():
+    """
+    This is a class for the roofline model of a machine: a set of memory bandwidth ceilings (in GB/s) and of
+    compute ceilings (in GFLOPS). The ceilings of all the loops of a report are computed at once with
+    array operations.
+
+    The names - field lists the bandwidth names followed by the peak names, roof indices returned by
+    classify refer to this list.
+    """
+
+    def __init__(self,bandwidths,peaks):
+        """
+        Input:
+        -------
+        bandwidths: dictionary of memory ceilings, name -> GB/s (e.g. {'drambandwidth':90.0,'l1bandwidth':3000.0})
+        peaks     : dictionary of compute ceilings, name -> GFLOPS (e.g. {'scalaraddpeak':40.0,'dpvectorfmapeak':2000.0})
+        -------
+        """
+
+        self.bandwidth_names = list(bandwidths)
+        self.peak_names = list(peaks)
+        self.bandwidths = np.array([bandwidths[name] for name in self.bandwidth_names],dtype=np.float64)
+        self.peaks = np.array([peaks[name] for name in self.peak_names],dtype=np.float64)
+        self.names = self.bandwidth_names + self.peak_names
+
+    @staticmethod
+    def from_roofs(r):
+        """
+        Build the model from the ceilings selected in a roofs object
+        """
+        return r.model()
+
+    @staticmethod
+    def from_ceilings(ceilings):
+        """
+        Build the model from a dictionary of ceilings: names ending with 'bandwidth' are memory ceilings
+        and names ending with 'peak' are compute ceilings.
+        """
+
+        bandwidths = dict()
+        peaks = dict()
+        for name,value in ceilings.items():
+            if name.endswith('bandwidth'):
+                bandwidths[name] = value
+            elif name.endswith('peak'):
+                peaks[name] = value
+
+        return roofline_model(bandwidths,peaks)
+
+    def curves(self,x,bandwidths=None,peaks=None):
+        """
+        Return the roofs min(peak,x*bandwidth) for every combination of the bandwidths and peaks, as an
+        array of shape (number of bandwidths * number of peaks, len(x)).
+
+        Input:
+        -------
+        x         : array of arithmetic intensities (flops/byte)
+        bandwidths: list of bandwidth names to use (default: all)
+        peaks     : list of peak names to use (default: all)
+        -------
+        """
+
+        bw = self.bandwidths if bandwidths is None else np.array([self.bandwidths[self.bandwidth_names.index(name)] for name in bandwidths])
+        flops = self.peaks if peaks is None else np.array([self.peaks[self.peak_names.index(name)] for name in peaks])
+
+        x = np.asarray(x,dtype=np.float64)
+        y = np.minimum(flops[np.newaxis,:,np.newaxis],bw[:,np.newaxis,np.newaxis] * x)
+
+        return y.reshape(len(bw) * len(flops),len(x))
+
+    def attainable(self,ai):
+        """
+        Return the attainable GFLOPS at the arithmetic intensities ai, under the highest bandwidth and peak
+        """
+        return np.minimum(self.peaks.max(),np.asarray(ai,dtype=np.float64) * self.bandwidths.max())
+
+    def classify(self,ai,gflops):
+        """
+        Find for every loop the binding roof: the lowest ceiling, memory (ai*bandwidth) or compute (peak),
+        that is above the GFLOPS of the loop. Memory ceilings are capped by the highest peak, where they
+        reach it the highest peak is the binding roof. Loops above every ceiling are bound by the highest peak.
+
+        Input:
+        -------
+        ai     : array of arithmetic intensities of the loops
+        gflops : array of GFLOPS of the loops
+        -------
+
+        Output:
+        -------
+        roof      : index of the binding roof in names, -1 where ai or gflops is NaN
+        ceiling   : value of the binding roof at ai, in GFLOPS
+        percent   : percentage of the binding roof reached by the loop
+        -------
+        """
+
+        ai = np.asarray(ai,dtype=np.float64)
+        gflops = np.asarray(gflops,dtype=np.float64)
+
+        # All the ceilings at the intensity of every loop, shape (number of roofs, number of loops)
+        memory = self.bandwidths[:,np.newaxis] * ai[np.newaxis,:]
+        top = np.inf if len(self.peaks) == 0 else self.peaks.max()
+        ceilings = np.concatenate([np.minimum(memory,top),
+                                   np.repeat(self.peaks[:,np.newaxis],len(ai),axis=1)])
+
+        with np.errstate(invalid='ignore'):
+            above = np.where(ceilings >= gflops[np.newaxis,:],ceilings,np.inf)
+            # Capped memory ceilings are the highest peak
+            above[:len(self.bandwidths)][memory > top] = np.inf
+        roof = np.argmin(above,axis=0)
+        none_above = np.isinf(above[roof,np.arange(len(ai))])
+        if len(self.peaks) == 0:
+            roof[none_above] = np.argmax(ceilings[:,none_above],axis=0)
+        else:
+            roof[none_above] = len(self.bandwidths) + np.argmax(self.peaks)
+
+        ceiling = ceilings[roof,np.arange(len(ai))]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            percent = 100.0 * gflops / ceiling
+
+        missing = np.isnan(ai) | np.isnan(gflops)
+        roof[missing] = -1
+        ceiling[missing] = np.nan
+        percent[missing] = np.nan
+
+        return roof,ceiling,percent
+
+class loop():
+    """
+    This is a class for accessing Advisor Data that is calculated per loop. Each loop has a list of
+    children that can contain more loop objects. The calling program has to take care of populating
+    the children list.
+
+    The data is not copied into the loop: a loop only keeps its row in the column store of the report,
+    and its attributes (loop.ai, loop.gflops, ...) are looked up in the store on access, by formatted key.
+    """
+
+    __slots__ = ['children','_tree','_row']
+
+    def __init__(self,tree,row):
+
+        self.children = list()
+
+        # Row of the loop in the hierarchy and in the column store of the report
+        self._tree = tree
+        self._row = row
+
+    def __getattr__(self,name):
+
+        # Only called for names that are not slots or methods
+        if name.startswith('_'):
+            raise AttributeError(name)
+        store = self._tree.store
+        try:
+            return store.get_raw(name,self._row)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        return sorted(set(object.__dir__(self)) | set(format_key(key) for key in self._tree.store.keys))
+
+    def has_data(self):
+        """
+        Returns True if both AI and GFLOPS strings have length greater than 0
+        """
+        return bool(self._tree.has_data[self._row])
+
+    def child_has_data(self):
+        """
+        Returns True if both AI and GFLOPS strings of any of the children have length greater than 0
+        """
+        return bool(self._tree.child_has_data[self._row])
+
+    def has_children(self):
+        """
+        Return True if the loop has at least one child
+        """
+        if (len(self.children)>0):
+            return True
+        else:
+            return False
+        
+class loop_tree():
+    """
+    This is a class for storing the parent/child hierarchy of the rows of a column store as index arrays.
+    Rows are in preorder, each loop being followed by its children, which can have children themselves.
+    The has_data and child_has_data properties of the loops are computed once for all the rows.
+
+    Fields:
+    -------
+    parent            : row of the parent of each row, -1 for the loops that are not children
+    depth             : nesting level of each row, 0 for the loops that are not children
+    top               : row of the outermost ancestor of each row (itself if it is not a child)
+    child_offsets     : the children of row are child_rows[child_offsets[row]:child_offsets[row+1]]
+    filled            : True if both the AI and GFLOPS cells are not empty
+    has_data          : filled and AI is not a bound like '< 0.0001'
+    child_has_data    : True if any of the children is filled
+    ancestor_has_data : True if any of the ancestors has data
+    -------
+    """
+
+    def __init__(self,store,parent):
+
+        self.store = store
+        self.parent = np.asarray(parent,dtype=np.int64)
+
+        n = len(self.parent)
+        rows = np.arange(n)
+        self.is_child = self.parent >= 0
+
+        # Go up the hierarchy one level at a time
+        self.depth = np.zeros(n,dtype=np.int64)
+        self.top = rows.copy()
+        up = np.where(self.is_child,self.parent,rows)
+        while True:
+            next_top = up[self.top]
+            if np.array_equal(next_top,self.top):
+                break
+            self.depth += next_top != self.top
+            self.top = next_top
+
+        # Children of each row, in compressed sparse row format
+        children = np.flatnonzero(self.is_child)
+        counts = np.bincount(self.parent[children],minlength=n)
+        self.child_rows = children[np.argsort(self.parent[children],kind='stable')]
+        self.child_offsets = np.zeros(n+1,dtype=np.int64)
+        self.child_offsets[1:] = np.cumsum(counts)
+
+        if store.has_key('ai') and store.has_key('gflops'):
+            ai = store.get_raw('ai')
+            gflops = store.get_raw('gflops')
+            # Both AI and GFLOPS strings have length greater than 0
+            self.filled = np.array([len(a) > 0 and len(g) > 0 for a,g in zip(ai,gflops)],dtype=bool)
+            # loop.has_data also rejects the AI values that are bounds
+            self.has_data = self.filled & np.array([a[0:1] != '<' for a in ai],dtype=bool)
+        else:
+            self.filled = np.zeros(n,dtype=bool)
+            self.has_data = np.zeros(n,dtype=bool)
+
+        self.child_has_data = np.zeros(n,dtype=bool)
+        self.child_has_data[self.parent[children[self.filled[children]]]] = True
+
+        # Parents come before their children, so one pass per level is enough
+        self.ancestor_has_data = np.zeros(n,dtype=bool)
+        for level in range(1,self.depth.max()+1 if n > 0 else 1):
+            level_rows = np.flatnonzero(self.depth == level)
+            level_parents = self.parent[level_rows]
+            self.ancestor_has_data[level_rows] = self.has_data[level_parents] | self.ancestor_has_data[level_parents]
+
+    def owned(self,valid):
+        """
+        Return a boolean array with the rows that are valid and have no valid ancestor. Summing a column
+        over these rows counts each part of a loop once, e.g. the self time of a parent already contains
+        the self times of its children, and a parent without GFLOP has the GFLOP of its children.
+        """
+
+        ancestor_valid = np.zeros(len(self.parent),dtype=bool)
+        for level in range(1,self.depth.max()+1 if len(self.parent) > 0 else 1):
+            level_rows = np.flatnonzero(self.depth == level)
+            level_parents = self.parent[level_rows]
+            ancestor_valid[level_rows] = valid[level_parents] | ancestor_valid[level_parents]
+
+        return valid & ~ancestor_valid
+
+    def children(self,row):
+        """
+        Return the rows of the children of row
+        """
+        return self.child_rows[self.child_offsets[row]:self.child_offsets[row+1]]
+
+    def build_loops(self):
+        """
+        Return the list of loop objects of the rows that are not children, with their children lists populated
+        """
+
+        loops = [loop(self,row) for row in range(len(self.parent))]
+        for row in np.flatnonzero(self.is_child).tolist():
+            loops[self.parent[row]].children.append(loops[row])
+
+        return [loops[row] for row in np.flatnonzero(~self.is_child).tolist()]
+
+class report_reader():
+    """
+    This is a class for reading the csv output file from Intel Advisor as a stream. The lines before
+    the line of keys are stored in the preamble - field and the keys in the keys - field. Iterating over
+    the reader yields the loops one at a time as lists of rows: the row of the loop followed by the rows
+    of its children. Only the rows of the current loop are kept in memory.
+    """
+
+    def __init__(self,fn):
+        """
+        This constructor reads the file until the line of keys.
+
+        Input:
+        -------------
+        fn: advisor report file to be read
+        -------------
+        """
+
+        self.filename = fn
+        self.preamble = list()
+        self.keys = None
+
+        with open(fn,mode='r') as infile:
+            reader = csv.reader(infile)
+            for row in reader:
+                if(len(row) > 0):
+                    # Search keys
+                    if row[0].find('ID') >= 0:
+                        self.keys = [x.lower() for x in row]
+                        break
+                    self.preamble.append(row)
+
+        if self.keys is None:
+            raise ValueError('No line of keys found in '+fn)
+
+    def __iter__(self):
+
+        with open(self.filename,mode='r') as infile:
+            reader = csv.reader(infile)
+
+            # Skip the preamble and the keys
+            for row in reader:
+                if len(row) > 0 and row[0].find('ID') >= 0:
+                    break
+
+            record = list()
+            for row in reader:
+                if(len(row) > 0):
+                    # Children follow their parent loop
+                    if row[1].find('child') > 0 and len(record) > 0:
+                        record.append(row)
+                    else:
+                        if len(record) > 0:
+                            yield record
+                        record = [row]
+
+            if len(record) > 0:
+                yield record
+
+class column_store():
+    """
+    This is a class for storing the cells of an Advisor report column by column. Each column is
+    kept once as a numpy array of the raw cell values and, if any of its cells can be converted
+    with convert_cell, as a float64 array together with a mask of the converted cells.
+    Columns can be looked up either with the raw key or with the formatted key used for the
+    loop attributes.
+
+    Each distinct cell of a column is stored once. String columns with few distinct values
+    (at most categorical_ratio of the rows, e.g. type, vector ISA, module or file) are kept
+    as categorical columns instead: integer codes and a vocabulary (see get_codes), which are
+    used to evaluate equality and membership filters. Their raw cells are looked up by get_raw.
+
+    Rows are added one at a time with append and converted to arrays by chunks of chunk_size rows,
+    so that only a chunk of raw rows is kept at any time. finalize has to be called once all the
+    rows are added.
+    """
+
+    chunk_size = 10000
+
+    # Largest ratio of distinct values to rows of the categorical columns
+    categorical_ratio = 0.5
+
+    def __init__(self,keys):
+        """
+        Input:
+        -------
+        keys: list of keys, one per column
+        -------
+        """
+
+        self.keys = keys
+        self.nrows = 0
+
+        # Column number of each formatted and raw key
+        self.index = dict()
+        for j,key in enumerate(keys):
+            self.index[format_key(key)] = j
+        for j,key in enumerate(keys):
+            self.index[key] = j
+
+        self.raw = list()
+        self.values = list()
+        self.valid = list()
+
+        # Codes and vocabulary of the categorical columns, by column number
+        self.categories = dict()
+
+        # Rows not converted yet and converted chunks of each column
+        self._pending = [list() for key in keys]
+        self._chunks = [list() for key in keys]
+
+        # Code and float value of each distinct cell of each column seen so far
+        self._vocab = [dict() for key in keys]
+        self._converted = [list() for key in keys]
+
+        # Typed columns parsed so far, see get_typed
+        self._typed = dict()
+
+    def append(self,vals):
+        """
+        Add a row to the store and return its row number
+        """
+
+        for j,val in enumerate(vals):
+            self._pending[j].append(val)
+        self.nrows += 1
+
+        if len(self._pending[0]) >= self.chunk_size:
+            self._convert_pending()
+
+        return self.nrows - 1
+
+    @instrumented('convert')
+    def _convert_pending(self):
+        """
+        Convert the pending rows of each column to arrays of codes into the distinct cells of the column
+        """
+
+        instrument_rows(len(self._pending[0]) if len(self._pending) > 0 else 0)
+
+        for j,col in enumerate(self._pending):
+
+            # Convert each distinct cell to a float only once
+            vocab = self._vocab[j]
+            converted = self._converted[j]
+            kind = column_types.get(format_key(self.keys[j]),'number')
+            codes = np.empty(len(col),dtype=np.int64)
+            for i,elem in enumerate(col):
+                code = vocab.get(elem)
+                if code is None:
+                    code = len(vocab)
+                    vocab[elem] = code
+                    converted.append(convert_cell(elem,kind))
+                codes[i] = code
+
+            self._chunks[j].append(codes)
+            self._pending[j] = list()
+
+    @instrumented('finalize')
+    def finalize(self):
+        """
+        Join the chunks of each column once all the rows are added
+        """
+
+        self._convert_pending()
+
+        for j,chunks in enumerate(self._chunks):
+            codes = np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0,dtype=np.int64)
+
+            vocab = np.empty(len(self._vocab[j]),dtype=object)
+            for elem,code in self._vocab[j].items():
+                vocab[code] = elem
+            converted = self._converted[j]
+            cell_valid = np.array([not felem is None for felem in converted],dtype=bool)
+            cell_values = np.array([np.nan if felem is None else felem for felem in converted],dtype=np.float64)
+
+            self._set_cells(j,codes,vocab)
+            valid = cell_valid[codes]
+            self.values.append(cell_values[codes] if valid.any() else None)
+            self.valid.append(valid)
+
+        if not active_instrumentation is None:
+            instrument_rows(self.nrows)
+            instrument_count('float_conversions',sum(len(converted) for converted in self._converted))
+            instrument_count('failed_float_conversions',sum(converted.count(None) for converted in self._converted))
+
+        self._pending = None
+        self._chunks = None
+        self._vocab = None
+        self._converted = None
+
+    def add_column(self,key,raw,codes=None):
+        """
+        Add a column of raw cells to a finalized store, converting each distinct cell once.
+        If codes is given, the cells of the rows are raw[codes].
+        """
+
+        j = len(self.keys)
+        self.keys.append(key)
+        if not format_key(key) in self.index:
+            self.index[format_key(key)] = j
+        self.index[key] = j
+
+        vocab = dict()
+        cell_codes = np.array([vocab.setdefault(elem,len(vocab)) for elem in list(raw)],dtype=np.int64)
+        codes = cell_codes if codes is None else cell_codes[codes]
+        cells = np.empty(len(vocab),dtype=object)
+        for elem,code in vocab.items():
+            cells[code] = elem
+        kind = column_types.get(format_key(key),'number')
+        converted = [convert_cell(elem,kind) for elem in cells.tolist()]
+        cell_valid = np.array([not felem is None for felem in converted],dtype=bool)
+        cell_values = np.array([np.nan if felem is None else felem for felem in converted],dtype=np.float64)
+
+        self._set_cells(j,codes,cells)
+        valid = cell_valid[codes]
+        self.values.append(cell_values[codes] if valid.any() else None)
+        self.valid.append(valid)
+
+    def _set_cells(self,j,codes,vocab):
+        """
+        Add the raw cells of column j, vocab[codes]. String columns with few distinct values are categorical:
+        only their codes and vocabulary are kept, and their cells are looked up when they are read (see get_raw).
+        The cells of the other columns share the objects of the vocabulary.
+        """
+        if len(vocab) <= self.categorical_ratio * self.nrows and all(isinstance(elem,str) for elem in vocab):
+            self.categories[j] = (codes.astype(np.int32) if len(vocab) < 2**31 else codes,vocab)
+            self.raw.append(None)
+        else:
+            self.raw.append(vocab[codes])
 
-    def __init__(self,fn,single=False):
+    def get_codes(self,key):
+        """
+        Return the codes and the vocabulary of the categorical column key, so that get_raw(key) is
+        vocabulary[codes], or None,None if the column is not categorical
+        """
+        return self.categories.get(self.index[key],(None,None))
 
-        #Read in Roofs    
-        fh=open('roofs.dat')
-        lines = fh.readlines()
-        for line in lines:
-            bw = None
-            if(single):
-                if 'single-threaded' in line and (('compute' in line) or ('memory' in line)):
-                    bw = int(line.split()[-2])
-                    i = max(line.find('Peak'),line.find('idth')) + 4
+    def code_mask(self,key,strings):
+        """
+        Return the rows where the categorical column key is one of strings, comparing integer codes,
+        or None if the column is not categorical
+        """
+        codes,vocab = self.get_codes(key)
+        if codes is None:
+            return None
+        wanted = [code for code,elem in enumerate(vocab.tolist()) if elem in strings]
+        if len(wanted) == 0:
+            return np.zeros(self.nrows,dtype=bool)
+        if len(wanted) == 1:
+            return codes == wanted[0]
+        return np.isin(codes,wanted)
+
+    def encode(self):
+        """
+        Encode the store into a few contiguous numpy arrays. The raw columns are dictionary encoded:
+        strings are replaced by codes into a vocabulary stored as utf-8 bytes and offsets. Return a
+        dictionary of arrays and a dictionary describing the columns, needed by decode, or None if a
+        column can't be encoded.
+        """
+
+        ncols = len(self.keys)
+        codes = np.zeros((ncols,self.nrows),dtype=np.int64)
+        kinds = list()
+        counts = list()
+        vocabulary = list()
+
+        for j,raw in enumerate(self.raw):
+            if j in self.categories:
+                column_codes,vocab = self.categories[j]
+                codes[j] = column_codes
+                kinds.append('str')
+                counts.append(len(vocab))
+                vocabulary.extend(vocab.tolist())
+                continue
+            types = set(type(elem) for elem in raw)
+            if types <= set([str]):
+                vocab = dict()
+                codes[j] = [vocab.setdefault(elem,len(vocab)) for elem in raw]
+                kinds.append('str')
+                counts.append(len(vocab))
+                vocabulary.extend(vocab)
+            elif types == set([bool]) or types == set([int]):
+                codes[j] = raw.astype(np.int64)
+                kinds.append(types.pop().__name__)
+                counts.append(0)
             else:
-                if not 'single-threaded' in line and (('compute' in line) or ('memory' in line)):
-                    bw = int(line.split()[-2])
+                return None,None
+
+        encoded = [elem.encode('utf-8') for elem in vocabulary]
+        offsets = np.zeros(len(encoded)+1,dtype=np.int64)
+        offsets[1:] = np.cumsum([len(elem) for elem in encoded])
+
+        numeric = [j for j in range(ncols) if not self.values[j] is None]
+        values = np.zeros((len(numeric),self.nrows),dtype=np.float64)
+        for k,j in enumerate(numeric):
+            values[k] = self.values[j]
+        valid = np.zeros((ncols,self.nrows),dtype=bool)
+        for j in range(ncols):
+            valid[j] = self.valid[j]
+
+        arrays = {'codes':codes,
+                  'values':values,
+                  'valid':valid,
+                  'strings':np.frombuffer(b''.join(encoded),dtype=np.uint8),
+                  'offsets':offsets}
+        columns = {'nrows':self.nrows,'kinds':kinds,'counts':counts,'numeric':numeric}
+
+        return arrays,columns
+
+    def save(self,path,tag):
+        """
+        Write the arrays of encode as .npy files named name.tag.npy in the directory path. Each file is
+        written to a temporary file first and then renamed, so that existing files are never changed in
+        place. Return the dictionary describing the columns, needed by load, or None if a column can't
+        be encoded.
+        """
 
-            if not bw is None:
-                i = max(line.find('Peak'),line.find('idth')) + 4
-                key = line[:i]
-                formatted_key = ''.join(key.split()).lower()
-                setattr(self,formatted_key,bw * 1e-9)
-        fh.close()
+        arrays,columns = self.encode()
+        if arrays is None:
+            return None
 
-    def plot(self,ax=None):
+        for name,array in arrays.items():
+            save_array(os.path.join(path,'{0}.{1}.npy'.format(name,tag)),array)
 
-        if ax is None:
-            ax = pl.gca()
-        
-        xlim = np.array(ax.get_xlim())
-        ylim = np.array(ax.get_ylim())
+        columns['tag'] = tag
+        return columns
 
-        x = np.logspace(np.log10(xlim[0]),np.log10(xlim[1]),1000)
-        
-        for bw in [self.drambandwidth,self.l2bandwidth,self.l1bandwidth]:
-            for flops in [self.scalaraddpeak, self.dpvectoraddpeak,self.dpvectorfmapeak]:
-                y = np.minimum(np.ones(len(x)) * flops , x * bw)
-                ax.plot(x,y,color='k',ls='-',lw='2')
+    @staticmethod
+    def load(path,keys,columns):
+        """
+        Read a store written by save from the directory path. The codes, float values and masks are memory-mapped.
+
+        Input:
+        -------
+        path: directory of the .npy files
+        keys: list of keys, one per column
+        columns: dictionary returned by save
+        -------
+        """
 
+        arrays = dict()
+        for name in ['codes','values','valid','strings','offsets']:
+            arrays[name] = np.load(os.path.join(path,'{0}.{1}.npy'.format(name,columns['tag'])),mmap_mode='r')
 
-class loop():
+        return column_store.decode(arrays,keys,columns)
+
+    @staticmethod
+    def decode(arrays,keys,columns):
+        """
+        Build a store from the arrays and the description of the columns returned by encode
+        """
+
+        store = column_store(keys)
+        store.nrows = columns['nrows']
+
+        codes = arrays['codes']
+        values = arrays['values']
+        valid = arrays['valid']
+        blob = np.asarray(arrays['strings']).tobytes()
+        offsets = np.asarray(arrays['offsets'])
+
+        numeric = dict((j,k) for k,j in enumerate(columns['numeric']))
+        start = 0
+
+        for j,kind in enumerate(columns['kinds']):
+
+            if kind == 'str':
+                count = columns['counts'][j]
+                vocab = np.empty(count,dtype=object)
+                vocab[:] = [blob[offsets[i]:offsets[i+1]].decode('utf-8') for i in range(start,start+count)]
+                start += count
+                store._set_cells(j,np.asarray(codes[j]),vocab)
+            elif kind == 'bool':
+                store.raw.append(codes[j].astype(bool).astype(object))
+            else:
+                store.raw.append(codes[j].astype(object))
+
+            if j in numeric:
+                store.values.append(values[numeric[j]])
+            else:
+                store.values.append(None)
+            store.valid.append(valid[j])
+
+        store._pending = None
+        store._chunks = None
+        store._vocab = None
+        store._converted = None
+
+        return store
+
+    def has_key(self,key):
+        """
+        Return True if the store has a column for the raw or formatted key
+        """
+        return key in self.index
+
+    def get_raw(self,key,rows=None):
+        """
+        Return the raw cell values of the column key, optionally only for the given rows (or for a single row)
+        """
+        j = self.index[key]
+        raw = self.raw[j]
+        if raw is None:
+            codes,vocab = self.categories[j]
+            return vocab[codes] if rows is None else vocab[codes[rows]]
+        if rows is None:
+            return raw
+        return raw[rows]
+
+    def get_float(self,key,rows=None):
+        """
+        Return the float values of the column key and the mask of the cells that could be converted.
+        Cells that could not be converted are NaN.
+        """
+        j = self.index[key]
+        values = self.values[j]
+        valid = self.valid[j]
+        if values is None:
+            values = np.full(self.nrows,np.nan)
+        if rows is None:
+            return values,valid
+        return values[rows],valid[rows]
+
+    def get_typed(self,key,rows=None):
+        """
+        Return the cells of the column key parsed according to their type in column_types, optionally
+        only for the given rows. Each distinct cell is parsed once, and the parsed column is kept.
+
+        Output:
+        -------
+        dictionary of arrays: 'values' (float64, NaN where there is no value), 'flags' (uint8, sum of the
+        flag_* constants) and, for pairs, 'remainder' (float64, value in brackets) or, for lists, 'items'
+        and 'remainder' (tuples of the items outside and inside brackets; 'values' is the number of items)
+        -------
+        """
+
+        j = self.index[key]
+        typed = self._typed.get(j)
+        if typed is None:
+            kind = column_types.get(format_key(self.keys[j]),'number')
+            if j in self.categories:
+                inverse,cells = self.categories[j]
+            else:
+                cells,inverse = np.unique(self.raw[j],return_inverse=True)
+            parsed = [parse_cell(str(cell),kind) for cell in cells.tolist()]
+
+            typed = dict()
+            for name in parsed[0].keys() if len(parsed) > 0 else ['values','flags']:
+                dtype = {'values':np.float64,'flags':np.uint8}.get(name,np.float64 if kind == 'pair' else object)
+                column = np.empty(len(parsed),dtype=dtype)
+                for i,cell in enumerate(parsed):
+                    column[i] = cell[name]
+                typed[name] = column[inverse.ravel()]
+            self._typed[j] = typed
+
+        if rows is None:
+            return typed
+        return dict((name,column[rows]) for name,column in typed.items())
+
+    def get_array(self,key,rows):
+        """
+        Return the values of the column key for the given rows. The result is a float array if all
+        the cells could be converted, otherwise the converted and raw values are mixed as in
+        convert_cell.
+        """
+        values,valid = self.get_float(key,rows)
+        if valid.all():
+            return values
+        raw = self.get_raw(key,rows)
+        return np.array([v if ok else r for v,ok,r in zip(values,valid,raw)])
+
+    def get_sum(self,key):
+        """
+        Return the sum of all the cells of the column key that can be converted to floats
+        """
+        values,valid = self.get_float(key)
+        return values[valid].sum()
+
+class raw_columns(collections.abc.Mapping):
     """
-    This is a class for storing Advisor Data that is calculated per loop. Each loop has a list of
-    children that can contain more loop objects. The calling program has to take care of populating
-    the children list.
+    This is a class for the data dictionary of advisor_results: a read-only mapping key -> raw cells of the
+    column, looked up in the column store when they are read, so that categorical columns are not expanded
+    for every row while they are not used.
     """
 
-    def __init__(self,line,keys):
+    def __init__(self,store,keys):
+        self.store = store
+        self.columns = keys
+
+    def __getitem__(self,key):
+        if not key in self.columns:
+            raise KeyError(key)
+        return self.store.get_raw(key)
 
-        bad_chars = ['%',',','/','(',')','[',']']
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
         
-        self.children = list()
+class condition():
+    """
+    This is a class for declarative filters on the columns of an Advisor report. A condition is
+    built from keyword arguments key__op=value where key is a formatted key (loop attribute name)
+    and op is one of the operators below, op defaults to eq. All the terms of a condition have to
+    pass. Conditions can be combined with & (and), | (or) and ~ (not).
+
+    Example: condition(file='current_deposition.F90',line__in=[2681,2730,9552],selftime__gt=0.01)
+
+    Operators:
+    ----------
+    eq, ne            : equal / not equal. Numbers are compared to the converted cells, strings to the raw cells
+    lt, le, gt, ge    : numerical comparisons, cells that can't be converted never pass (see convert_cell,
+                        e.g. '< 0.0001' is compared as 0.0001 and '8; [8]' as 8)
+    in, notin         : membership in a list of numbers and/or strings
+    contains          : substring of the raw cells
+    ----------
+    """
 
-        # Creation of the attributes from line and keys
-        for key,val in zip(keys,line):
-            formatted_key = ''.join(key.split()).lower()
-            for char in bad_chars:
-                formatted_key = formatted_key.replace(char,'')
-            setattr(self,formatted_key,val)
+    operators = ['eq','ne','lt','le','gt','ge','in','notin','contains']
 
-    def has_data(self):
+    def __init__(self,**terms):
+
+        self.terms = list()
+        for name,val in terms.items():
+            key,sep,op = name.rpartition('__')
+            if sep == '':
+                key,op = name,'eq'
+            if not op in self.operators:
+                raise ValueError('Unknown filter operator {0} in {1}'.format(op,name))
+            self.terms.append((key,op,val))
+
+        # Combination of other conditions ('and','or','not'), None for a list of terms
+        self.combine = None
+        self.conditions = list()
+
+        # Mask of the last store the condition was evaluated on
+        self._store = None
+        self._mask = None
+
+    def __getstate__(self):
+        # The cached mask is not sent along when a condition is pickled
+        state = self.__dict__.copy()
+        state['_store'] = None
+        state['_mask'] = None
+        return state
+
+    def __and__(self,other):
+        return condition._combined('and',[self,other])
+
+    def __or__(self,other):
+        return condition._combined('or',[self,other])
+
+    def __invert__(self):
+        return condition._combined('not',[self])
+
+    @staticmethod
+    def _combined(combine,conditions):
+        cond = condition()
+        cond.combine = combine
+        cond.conditions = conditions
+        return cond
+
+    def mask(self,store):
         """
-        Returns True if both AI and GFLOPS strings have length greater than 0
+        Return a boolean array with the rows of the column store that pass the condition
         """
-        if len(self.ai) > 0 and (self.ai[0:1] != '<') and len(self.gflops) > 0:
-            return True
+
+        if self._store is store:
+            return self._mask
+
+        if self.combine == 'and':
+            mask = self.conditions[0].mask(store) & self.conditions[1].mask(store)
+        elif self.combine == 'or':
+            mask = self.conditions[0].mask(store) | self.conditions[1].mask(store)
+        elif self.combine == 'not':
+            mask = ~self.conditions[0].mask(store)
         else:
-            return False
+            mask = np.ones(store.nrows,dtype=bool)
+            for key,op,val in self.terms:
+                mask &= self._term_mask(store,key,op,val)
 
-    def child_has_data(self):
+        self._store = store
+        self._mask = mask
+        return mask
+
+    def _term_mask(self,store,key,op,val):
         """
-        Returns True if both AI and GFLOPS strings of any of the children have length greater than 0
+        Evaluate a single term of the condition on all the rows of the store
         """
 
-        for child in self.children:
-            if len(child.ai) > 0 and len(child.gflops) > 0:
-                return True
-                
-        return False
+        if op in ['lt','le','gt','ge']:
+            values,valid = store.get_float(key)
+            compare = {'lt':np.less,'le':np.less_equal,'gt':np.greater,'ge':np.greater_equal}[op]
+            with np.errstate(invalid='ignore'):
+                return valid & compare(values,val)
+        elif op == 'eq':
+            return self._equal_mask(store,key,[val])
+        elif op == 'ne':
+            return ~self._equal_mask(store,key,[val])
+        elif op == 'in':
+            return self._equal_mask(store,key,val)
+        elif op == 'notin':
+            return ~self._equal_mask(store,key,val)
+        else:
+            raw = store.get_raw(key)
+            return np.array([isinstance(elem,str) and val in elem for elem in raw],dtype=bool)
 
-    def has_children(self):
+    def _equal_mask(self,store,key,vals):
         """
-        Return True if the loop has at least one child
+        Return the rows where the column key is equal to any of the values in vals
         """
-        if (len(self.children)>0):
-            return True
+
+        mask = np.zeros(store.nrows,dtype=bool)
+
+        numbers = [v for v in vals if not isinstance(v,str)]
+        if len(numbers) > 0:
+            values,valid = store.get_float(key)
+            mask |= valid & np.isin(values,numbers)
+
+        strings = set(v for v in vals if isinstance(v,str))
+        if len(strings) > 0:
+            # Categorical columns are compared on their integer codes
+            codes = store.code_mask(key,strings)
+            if codes is None:
+                raw = store.get_raw(key)
+                codes = np.array([isinstance(elem,str) and elem in strings for elem in raw],dtype=bool)
+            mask |= codes
+
+        return mask
+
+class loop_table():
+    """
+    This is a class for the table of loops printed by print_loop_properties. The table is built once
+    from the rows of the store and written in pages, as fixed-width text, Markdown or CSV, to a file
+    object, the terminal or a pager.
+    """
+
+    # Keys of the columns of the table and their titles
+    keys = ['id','subroutine','file','line','ai','gflops','selftime']
+    titles = ['id','subroutine','file','line','AI','gflops','time']
+
+    formats = ['text','markdown','csv']
+
+    formatstr_function = '     Function: {0:67.30} {3:>10.10} {4:>10.10} {5:>10.10}'
+    formatstr_parent = ' {6:3.3} Loop:     {0:30.30} {1:>30.30} {2:>10} {3:>10.10} {4:>10.10} {5:>10.10}'
+    formatstr_child  = ' {6:3.3}  | Child: {0:30.30} {1:>30.30} {2:>10} {3:>10.10} {4:>10.10} {5:>10.10}'
+
+    def __init__(self,store,rows,kinds):
+        """
+        Input:
+        -------------
+        store: column_store of the loops
+        rows : rows of the store in the order of the table
+        kinds: kind of each row, 'Loop', 'Child' or 'Function'
+        -------------
+        """
+
+        self.rows = np.asarray(rows,dtype=np.int64)
+        self.kinds = np.asarray(kinds,dtype=object)
+        self.columns = dict((key,store.get_raw(key,self.rows)) for key in self.keys)
+        self.labels = store.get_raw('function call sites and loops',self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def header(self,fmt='text'):
+        """
+        Return the lines before the first row of the table
+        """
+
+        if fmt == 'text':
+            return [' {0:3.3} type      {1:^30.30} {2:^30.30} {3:^10.10} {4:^10.10} {5:^10.10} {6:^10.10}'.format(*self.titles),
+                    ' ------------------------------------------------------------------------------------------------------------------']
+        elif fmt == 'markdown':
+            return ['| type | ' + ' | '.join(self.titles) + ' |',
+                    '|' + '---|' * (len(self.titles) + 1)]
         else:
-            return False
-        
+            return [csv_line(['type'] + self.titles)]
+
+    def lines(self,start=0,stop=None,fmt='text'):
+        """
+        Return the lines of the rows start to stop of the table
+        """
+
+        page = range(start,min(len(self),len(self) if stop is None else stop))
+        subroutines,files,lines,ais,gflops,times,ids = [self.columns[key] for key in
+                                                        ['subroutine','file','line','ai','gflops','selftime','id']]
+
+        if fmt == 'text':
+            formatstr = {'Loop':self.formatstr_parent,'Child':self.formatstr_child,'Function':self.formatstr_function}
+            return [formatstr[self.kinds[i]].format(self.labels[i] if self.kinds[i] == 'Function' else subroutines[i],
+                                                    files[i],lines[i],ais[i],gflops[i],times[i],ids[i]) for i in page]
+
+        cells = [[self.kinds[i]] + [self.columns[key][i] for key in self.keys] for i in page]
+        if fmt == 'markdown':
+            return ['| ' + ' | '.join(str(cell).replace('|','\\|') for cell in row) + ' |' for row in cells]
+        return [csv_line(row) for row in cells]
+
+    @instrumented('write')
+    def write(self,fh,fmt='text',page_size=1000,header=True):
+        """
+        Write the table to the file object fh, one page of page_size rows at a time. Each page is joined
+        into a single string before it is written.
+        """
+
+        if not fmt in self.formats:
+            raise ValueError('Unknown table format {0}, use one of {1}'.format(fmt,self.formats))
+
+        if header:
+            fh.write('\n'.join(self.header(fmt)) + '\n')
+        page_size = max(1,page_size)
+        for start in range(0,len(self),page_size):
+            fh.write('\n'.join(self.lines(start,start+page_size,fmt)) + '\n')
+
+class point_index():
+    """
+    This is a class for finding the plotted point nearest to a click. The points are bucketed in a
+    regular grid in log10 space and sorted by bucket, so that a query only looks at the points of the
+    buckets that overlap the search area.
+    """
+
+    def __init__(self,x,y,cell=0.05):
+        """
+        Input:
+        -------------
+        x,y : arrays of the coordinates of the points, points with non-positive or NaN coordinates are never found
+        cell: size of the grid buckets in decades
+        -------------
+        """
+
+        x = np.asarray(x,dtype=np.float64)
+        y = np.asarray(y,dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            points = np.flatnonzero((x > 0) & (y > 0))
+
+        self.cell = cell
+        self.lx = np.log10(x[points])
+        self.ly = np.log10(y[points])
+
+        ix = np.floor(self.lx / cell).astype(np.int64)
+        iy = np.floor(self.ly / cell).astype(np.int64)
+        self.ix0 = ix.min() if len(points) > 0 else 0
+        self.iy0 = iy.min() if len(points) > 0 else 0
+        self.nx = ix.max() - self.ix0 + 1 if len(points) > 0 else 0
+        self.ny = iy.max() - self.iy0 + 1 if len(points) > 0 else 0
+
+        bucket = (ix - self.ix0) * self.ny + (iy - self.iy0)
+        order = np.argsort(bucket,kind='stable')
+        self.buckets = bucket[order]
+        self.points = points[order]
+        self.lx = self.lx[order]
+        self.ly = self.ly[order]
+
+    def query(self,x,y,x1,y1):
+        """
+        Return the index of the point nearest to (x,y) inside the ellipse with semi-axes |x1-x| and |y1-y|
+        in log space, -1 if there is none.
+        """
+
+        if len(self.points) == 0 or x <= 0 or y <= 0 or x1 <= 0 or y1 <= 0:
+            return -1
+
+        qx,qy = np.log10(x),np.log10(y)
+        rx,ry = abs(np.log10(x1) - qx),abs(np.log10(y1) - qy)
+        if rx == 0 or ry == 0:
+            return -1
+
+        ix = np.arange(max(int(np.floor((qx - rx) / self.cell)) - self.ix0,0),
+                       min(int(np.floor((qx + rx) / self.cell)) - self.ix0,self.nx - 1) + 1)
+        iy_min = max(int(np.floor((qy - ry) / self.cell)) - self.iy0,0)
+        iy_max = min(int(np.floor((qy + ry) / self.cell)) - self.iy0,self.ny - 1)
+        if len(ix) == 0 or iy_min > iy_max:
+            return -1
+
+        # Each column of buckets is a contiguous range of the sorted points
+        first = np.searchsorted(self.buckets,ix * self.ny + iy_min,side='left')
+        last = np.searchsorted(self.buckets,ix * self.ny + iy_max,side='right')
+        candidates = np.concatenate([np.arange(i,j) for i,j in zip(first,last)])
+        if len(candidates) == 0:
+            return -1
+
+        distance = ((self.lx[candidates] - qx) / rx)**2 + ((self.ly[candidates] - qy) / ry)**2
+        nearest = np.argmin(distance)
+        if distance[nearest] > 1:
+            return -1
+
+        return self.points[candidates[nearest]]
+
 class advisor_results():
     """
     This class parses the data from a csv output file from Intel Advisor and stores it in a python
-    object. The raw data is stored in dictionary format in the data - field with keys in the keys - field.
+    object. The raw data is stored column by column in a column_store in the store - field, with keys
+    in the keys - field. The data dictionary gives access to the raw columns by key.
     The data is also kept in loop-objects that keep track of the parent-child relationships of loops, these
     are stored in the loops - field. There are methods to plot the data and to calculate sums.
     """
 
-    def __init__(self,fn):
+    # Number of plotted loops above which plot draws a density map or a rasterized scatter plot
+    dense_threshold = 100000
+    rasterize_threshold = 5000
+
+    # Distance in pixels of a click to a loop for its tooltip to be shown
+    tooltip_pixels = 5
+
+    @instrumented('advisor_results')
+    def __init__(self,fn,cache=True):
         """
-        This constructor reads the csv data file and creates the dictionary and loop objects.
+        This constructor reads the csv data file and creates the column store and loop objects.
+        The parsed report is cached in a directory next to the file (see cache_path) and read from
+        there on later loads, as long as the file has not changed.
 
         Input:
         -------------
         fn: advisor report file to be read
+        cache: if True, read and write the binary cache of the report
         -------------
         """
 
+        self.filename = fn
 
-        lines = list()
+        if not (cache and self.read_cache()):
+            self.parse(fn)
+            if cache:
+                self.write_cache()
 
-        self.filename = fn
-        
-        # Open the file and store the lines
-        with open(fn,mode='r') as infile:
-            reader = csv.reader(infile)
-            for row in reader:
-                if(len(row) > 0):
-                    lines.append(row)
-        self.lines = lines
+        self._build_index()
+        instrument_rows(self.store.nrows)
 
-        # Search keys
-        for i,l in enumerate(lines):
-            if l[0].find('ID') >= 0:
-                keyLineId = i
-                break
-        self.keys = [x.lower() for x in lines[keyLineId]]
+    @instrumented('build_index')
+    def _build_index(self):
+        """
+        Build the data dictionary and the masks used by the queries once the store is filled
+        """
+
+        # The data dictionnary gives access to the raw columns of the store
+        self.data = raw_columns(self.store,self.keys)
+
+        self.labels = self.data['function call sites and loops']
+
+        self._build_order()
 
-        # Bonus keys
-        self.keys.append('child')        
-        self.keys.append('subroutine')
-        self.keys.append('file')
-        self.keys.append('line')
+    @instrumented('parse')
+    def parse(self,fn):
+        """
+        This method reads the csv data file one loop at a time and fills the column store and the loop objects.
+        """
 
-        # Loop information is also stored in a dictionnary
-        self.data = dict()
+        # The report is read one loop at a time
+        reader = report_reader(fn)
+        self.preamble = reader.preamble
 
-        # List of loops
-        self.loops = list()
+        # Cells of each column
+        store = column_store(list(reader.keys))
+
+        # Row of the parent of each row, -1 for the loops that are not children
+        parent = list()
         
-        # data[key] is a list 
-        for key in self.keys:
-            self.data[key] = list()
+        with instrument_stage('read'):
+            for record in reader:
+
+                # add loop and its children, the rows of the ancestors of the current row are kept in stack
+                stack = list()
+                for l in record:
+                    depth = min(child_depth(l[1]),len(stack))
+                    del stack[depth:]
+                    parent.append(stack[-1] if depth > 0 else -1)
+                    stack.append(store.append(l))
+            instrument_rows(store.nrows)
+
+        store.finalize()
+
+        # Bonus keys, parsed from the function call sites and loops column at once
+        with instrument_stage('locations'):
+            codes,locations = unique_locations(store.get_raw('function call sites and loops'))
+            for key in ['child','subroutine','file','line']:
+                store.add_column(key,locations[key],codes)
+            instrument_rows(store.nrows)
+            if not active_instrumentation is None:
+                instrument_count('malformed_locations',int(np.count_nonzero(locations['malformed'][codes])))
+        self.keys = store.keys
+
+        self._set_store(store,np.array(parent,dtype=np.int64),self.keys,self.preamble)
+
+    def cache_path(self):
+        """
+        Return the directory of the binary cache of the report
+        """
+        return self.filename + '.pyadvisor'
+
+    @instrumented('read_cache')
+    def read_cache(self):
+        """
+        Read the report from the binary cache. The cache is used only if the size of the file is the
+        same as when it was written and either its modification time or its content hash also match.
+        Return True on success.
+        """
+
+        path = self.cache_path()
+        try:
+            with open(os.path.join(path,'meta.json'),mode='r') as fh:
+                meta = json.load(fh)
+            stat = os.stat(self.filename)
+        except (OSError,ValueError):
+            return False
+
+        # A meta.json with missing or malformed fields is a miss, like a missing file
+        try:
+            if meta['version'] != cache_version or meta['size'] != stat.st_size:
+                return False
+
+            if meta['mtime'] != stat.st_mtime:
+                # The file has been touched, check that its content is the same
+                if meta['hash'] != file_hash(self.filename):
+                    return False
+                meta['mtime'] = stat.st_mtime
+                try:
+                    save_json(os.path.join(path,'meta.json'),meta)
+                except OSError:
+                    pass
+
+            keys,preamble = meta['keys'],meta['preamble']
+            store = column_store.load(path,keys,meta['columns'])
+            parent = np.load(os.path.join(path,'parent.{0}.npy'.format(meta['columns']['tag'])))
+        except (OSError,ValueError,KeyError,TypeError,IndexError):
+            return False
+
+        self._set_store(store,parent,keys,preamble)
+
+        return True
+
+    @instrumented('build_tree')
+    def _set_store(self,store,parent,keys,preamble):
+        """
+        Use an already filled store, build the hierarchy of its rows and the loop objects
+        """
+
+        self.store = store
+        self.keys = keys
+        self.preamble = preamble
+        self.rank = mpi_rank(preamble)
+
+        self.tree = loop_tree(store,parent)
+        self.loops = self.tree.build_loops()
+
+        # Loops in the order of the report, and the sort permutations computed so far (see argsort)
+        self._report_loops = list(self.loops)
+        self._sort_cache = dict()
+
+    def encode(self):
+        """
+        Return the report as a dictionary of numpy arrays and a dictionary describing them, see
+        column_store.encode. Used to send parsed reports between processes. Return None,None if
+        the store can't be encoded.
+        """
+
+        arrays,columns = self.store.encode()
+        if arrays is None:
+            return None,None
+
+        arrays['parent'] = self.tree.parent
+        info = {'filename':self.filename,
+                'keys':self.keys,
+                'preamble':self.preamble,
+                'columns':columns}
+
+        return arrays,info
+
+    @staticmethod
+    def decode(arrays,info):
+        """
+        Build a report from the result of encode
+        """
+
+        adv = advisor_results.__new__(advisor_results)
+        adv.filename = info['filename']
+        store = column_store.decode(arrays,info['keys'],info['columns'])
+        adv._set_store(store,arrays['parent'],info['keys'],info['preamble'])
+        adv._build_index()
+
+        return adv
+
+    @staticmethod
+    def load_many(paths,workers=None,cache=True,combine=False):
+        """
+        Read several advisor reports in parallel in a pool of worker processes. The parsed reports
+        are sent back from the workers as a few numpy arrays each (see encode). With a single worker,
+        the reports are read in the calling process.
+
+        Input:
+        -------
+        paths   : list of advisor report files to be read
+        workers : number of worker processes (default: number of cores)
+        cache   : if True, the workers read and write the binary caches of the reports
+        combine : if True, return a single column_store with all the reports (see combine_stores)
+        -------
+
+        Output:
+        -------
+        list of advisor_results objects in the order of paths, or a column_store if combine is True
+        -------
+        """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1,min(workers,len(paths)))
+
+        tasks = [(fn,cache) for fn in paths]
+        if workers == 1:
+            # Read in this process, the reports don't need to be encoded
+            results = [advisor_results(fn,cache=cache) for fn in paths]
+        else:
+            # multiprocessing is only imported here, it is not needed by the single-process scripts
+            import multiprocessing
+            with multiprocessing.Pool(workers) as pool:
+                encoded = pool.map(load_encoded,tasks,chunksize=1)
+
+            results = list()
+            for (fn,cache),(arrays,info) in zip(tasks,encoded):
+                if arrays is None:
+                    # The report could not be encoded by the worker
+                    results.append(advisor_results(fn,cache=cache))
+                else:
+                    results.append(advisor_results.decode(arrays,info))
+
+        if combine:
+            return combine_stores([adv.store for adv in results],paths)
+
+        return results
+
+    @instrumented('write_cache')
+    def write_cache(self):
+        """
+        Write the parsed report to the binary cache. Nothing is written if the directory of the report
+        is not writable. Return True on success.
+
+        Reports loaded from the cache memory-map its files, possibly in other processes. The files are
+        therefore never rewritten: each write uses new file names (tagged with the process and the time),
+        meta.json is replaced last and only then are the files of the previous cache removed. The mapped
+        files stay readable after their removal.
+        """
+
+        path = self.cache_path()
+        tag = '{0}-{1}'.format(os.getpid(),time.time_ns())
+        try:
+            stat = os.stat(self.filename)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+
+            columns = self.store.save(path,tag)
+            if columns is None:
+                return False
+            save_array(os.path.join(path,'parent.{0}.npy'.format(tag)),self.tree.parent)
+
+            meta = {'version':cache_version,
+                    'size':stat.st_size,
+                    'mtime':stat.st_mtime,
+                    'hash':file_hash(self.filename),
+                    'keys':self.keys,
+                    'preamble':self.preamble,
+                    'columns':columns}
+            save_json(os.path.join(path,'meta.json'),meta)
+        except OSError:
+            return False
+
+        # Files of the previous caches
+        for name in os.listdir(path):
+            if name.endswith('.npy') and not name.endswith('.{0}.npy'.format(tag)):
+                try:
+                    os.remove(os.path.join(path,name))
+                except OSError:
+                    pass
 
-        for i,l in enumerate(lines[keyLineId+1:]):
+        return True
 
-            # Add loop to the list of loops
-            if not l[1].find('child') > 0:
+    def to_arrow(self):
+        """
+        Return the report as a pyarrow Table. Each column of the store is a column of the table with its raw
+        cells, dictionary encoded for the categorical columns. Columns with numbers also have a float64
+        column key+'#value' (NaN where the cell is not a number) and a boolean column key+'#valid'. The
+        row of the parent of each row is in the column '#parent'. The keys, preamble and report file are
+        stored in the schema metadata. Requires pyarrow.
+        """
 
-                # Some treatments to get new attributes
-                self.parse_functioncallsitesandloops(l[1],l,self.keys)
-                # add loop
-                self.loops.append(loop(l,self.keys))
+        pa = import_pyarrow()
 
+        names = list()
+        arrays = list()
+        for j,key in enumerate(self.keys):
+            codes,vocab = self.store.get_codes(key)
+            if not codes is None:
+                column = pa.DictionaryArray.from_arrays(pa.array(codes,type=pa.int32()),pa.array(vocab.tolist(),type=pa.string()))
             else:
-                # Some treatments
-                self.parse_functioncallsitesandloops(l[1],l,self.keys)
-                # add loop
-                self.loops[-1].children.append(loop(l,self.keys))
-            
-            # Add value to each key of the loop of the data dictionnary
-            for j,val in enumerate(l):
-                self.data[self.keys[j]].append(val)
-                
-        self.labels = self.data['function call sites and loops']
+                raw = self.store.get_raw(key)
+                types = set(type(elem) for elem in raw)
+                if len(types) == 1 and types.pop() in [str,int,bool]:
+                    column = pa.array(raw.tolist())
+                else:
+                    column = pa.array([str(elem) for elem in raw],type=pa.string())
+            names.append(key)
+            arrays.append(column)
+
+            if not self.store.values[j] is None:
+                values,valid = self.store.get_float(key)
+                names += [key+'#value',key+'#valid']
+                arrays += [pa.array(np.asarray(values)),pa.array(np.asarray(valid))]
+
+        names.append('#parent')
+        arrays.append(pa.array(self.tree.parent))
+
+        metadata = {'pyadvisor':json.dumps({'version':cache_version,
+                                            'filename':self.filename,
+                                            'keys':self.keys,
+                                            'preamble':self.preamble})}
+
+        return pa.Table.from_arrays(arrays,names=names,metadata=metadata)
+
+    def write_arrow(self,fn,fmt=None):
+        """
+        Write the report (see to_arrow) to an Arrow IPC file or a Parquet file. Requires pyarrow.
+
+        Input:
+        -------
+        fn : output file
+        fmt: 'parquet' or 'ipc' (default: 'parquet' if fn ends with .parquet or .pq, 'ipc' otherwise)
+        -------
+        """
+
+        pa = import_pyarrow()
+        table = self.to_arrow()
+
+        if fmt is None:
+            fmt = 'parquet' if os.path.splitext(fn)[1] in ['.parquet','.pq'] else 'ipc'
+
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table,fn)
+        elif fmt == 'ipc':
+            with pa.OSFile(fn,'wb') as sink:
+                with pa.ipc.new_file(sink,table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            raise ValueError('Unknown arrow format {0}, use parquet or ipc'.format(fmt))
+
+    @staticmethod
+    def read_arrow(fn,fmt=None):
+        """
+        Build a report from a file written by write_arrow. Arrow IPC files are memory-mapped and their
+        codes and float columns are used without copies. Requires pyarrow.
+        """
+
+        pa = import_pyarrow()
+
+        if fmt is None:
+            fmt = 'parquet' if os.path.splitext(fn)[1] in ['.parquet','.pq'] else 'ipc'
+
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(fn,memory_map=True)
+        else:
+            table = pa.ipc.open_file(pa.memory_map(fn,'r')).read_all()
+
+        return advisor_results.from_arrow(table)
+
+    @staticmethod
+    def from_arrow(table):
+        """
+        Build a report from a pyarrow Table made by to_arrow
+        """
+
+        info = json.loads(table.schema.metadata[b'pyadvisor'])
+        keys = info['keys']
+        names = set(table.column_names)
+
+        store = column_store(keys)
+        store.nrows = table.num_rows
+
+        for j,key in enumerate(keys):
+            column = table.column(key).combine_chunks()
+            if hasattr(column,'indices'):
+                codes = column.indices.to_numpy(zero_copy_only=False)
+                vocab = np.empty(len(column.dictionary),dtype=object)
+                vocab[:] = column.dictionary.to_pylist()
+                store._set_cells(j,codes,vocab)
+            else:
+                raw = np.empty(table.num_rows,dtype=object)
+                raw[:] = column.to_pylist()
+                store.raw.append(raw)
+
+            if key+'#value' in names:
+                store.values.append(table.column(key+'#value').combine_chunks().to_numpy(zero_copy_only=False))
+                store.valid.append(table.column(key+'#valid').combine_chunks().to_numpy(zero_copy_only=False))
+            else:
+                store.values.append(None)
+                store.valid.append(np.zeros(table.num_rows,dtype=bool))
+
+        store._pending = None
+        store._chunks = None
+        store._vocab = None
+        store._converted = None
+
+        adv = advisor_results.__new__(advisor_results)
+        adv.filename = info['filename']
+        parent = table.column('#parent').combine_chunks().to_numpy(zero_copy_only=False)
+        adv._set_store(store,parent,keys,info['preamble'])
+        adv._build_index()
+
+        return adv
+
+    def _build_order(self):
+        """
+        Compute the order of the rows following the current order of the list of loops, each parent
+        being followed by its children.
+        """
+
+        n = self.store.nrows
+        self._rank = np.zeros(n,dtype=np.int64)
+        self._rank[[loop._row for loop in self.loops]] = np.arange(len(self.loops))
+
+        # Rank of the outermost ancestor of each row
+        self._order = np.argsort(self._rank[self.tree.top],kind='stable')
 
     def get_keys(self):
         """
@@ -199,13 +1943,16 @@ class advisor_results():
         for k,key in enumerate(self.keys):
             print(' {0:2} - {1}'.format(k,key))
 
+    @instrumented('plot')
     def plot(self,fignum=1,markersize=20,mrk='o',newfig=True,label=None,tooltips=True,
              filterVal=None,filterKey=None,filterOp=None,sizeKey=None,colorKey=None,
-             vmin=None,vmax=None,gflopScaling=1.0):
+             vmin=None,vmax=None,gflopScaling=1.0,where=None,dense=None,gridsize=100,ax=None):
         """
         This method plots all the loops in the object in a scatter plot on log-log scale.
         Marker size represents the self time of the loop (in seconds) and marker color represents
-        the estimated vectorization gain.
+        the estimated vectorization gain. Above dense_threshold loops, the loops are drawn as a
+        hexagonal density map weighted by the marker sizes, and above rasterize_threshold the
+        scatter plot is rasterized.
 
         Inputs:
         -------
@@ -219,69 +1966,87 @@ class advisor_results():
         filterVal  : any - threshold value to filter plotted loops (default None)
         filterKey  : any - attribute name for comparison to threshold in filter (default None)
         filterOp   : function - function to use for filtering. Must take in two arguments and return True/False (default None)
+        where      : condition - condition the plotted loops have to pass (default None)
         sizeKey    : string/int/float - key to retrieve marker sizes or fixed marker size understood by scatter
         colorKey   : string/int/float - key to retrieve marker colors or fixed marker color understood by scatter
         vmin       : float - minimum of the color scale
         vmax       : float - maximum of the color scale
+        dense      : boolean - draw a density map instead of a scatter plot (default None, decided by dense_threshold)
+        gridsize   : integer - number of hexagons in the x-direction of the density map (default 100)
+        ax         : axes to draw in, fignum and newfig are then ignored and the figure is not shown (default None)
         -------
         """
         
-        # Tooltip code adapted from http://matplotlib.sourceforge.net/examples/event_handling/pick_event_demo.html
-        
-        fig = plt.figure(fignum)
-        if newfig:
-            plt.clf()
-        ax = plt.gca()
-        
-        x = self.get_array(key='ai',
-                           filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-        y = self.get_array(key='gflops',
-                           filterVal=filterVal,filterKey=filterKey,filterOp=filterOp) * gflopScaling
-        if type(sizeKey) is str:
-            s = self.get_array(key=sizeKey,
-                               filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-            #convert empty cells to 0's and then convert the array dtype to float
-            if s.dtype.type is np.str_:
-                s[s==''] = 0
-                s = np.array([float(foo) for foo in s])
-        elif sizeKey is None:
-            s = markersize
-        else:
-            s = sizeKey            
-            
-        if type(colorKey) is str and len(colorKey) > 1:
-            c = self.get_array(key=colorKey,
-                               filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-            #convert empty cells to 0's and then convert the array dtype to float
-            if c.dtype.type is np.str_:
-                c[c==''] = 0
-                c = np.array([float(foo) for foo in c])
-        elif colorKey is None:
-            c = 'b'
-        else:
-            c = colorKey
-            
-        labels = self.get_array(key='functioncallsitesandloops',
-                                filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-        
+        with instrument_stage('figure'):
+            plt = import_pyplot()
+            if ax is None:
+                fig = plt.figure(fignum)
+                if newfig:
+                    plt.clf()
+                ax = plt.gca()
+                show = True
+            else:
+                fig = ax.figure
+                show = False
+
+        with instrument_stage('data'):
+            # All the columns are taken from the same rows, filtered once
+            rows = self.get_rows(filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+
+            # Cells that can't be converted are not drawn
+            x = self.get_floats('ai',rows,np.nan)
+            y = self.get_floats('gflops',rows,np.nan) * gflopScaling
+
+            if type(sizeKey) is str:
+                #convert empty cells to 0's
+                s = self.get_floats(sizeKey,rows,0.0)
+            elif sizeKey is None:
+                s = markersize
+            else:
+                s = sizeKey            
+            
+            if type(colorKey) is str and len(colorKey) > 1:
+                #convert empty cells to 0's
+                c = self.get_floats(colorKey,rows,0.0)
+            elif colorKey is None:
+                c = 'b'
+            else:
+                c = colorKey
+            instrument_rows(len(rows))
+
+        if dense is None:
+            dense = len(rows) > self.dense_threshold
+
+        with instrument_stage('draw'):
+            if dense:
+                # Only points with positive coordinates can be placed on the log-log grid
+                shown = (x > 0) & (y > 0)
+                weights = np.broadcast_to(s,x.shape)[shown] if type(sizeKey) is str else None
+                scatter = ax.hexbin(x[shown],y[shown],C=weights,gridsize=gridsize,xscale='log',yscale='log',
+                                    reduce_C_function=np.sum,bins='log',mincnt=1,cmap=plt.cm.jet,label=label)
+            else:
+                scatter = ax.scatter(x,y,s*markersize,c,marker=mrk,vmin=vmin,vmax=vmax,label=label,cmap=plt.cm.jet,
+                                     rasterized=len(rows) > self.rasterize_threshold)
+
         if tooltips:
+            # Clicks are matched to the nearest loop with a grid index of the points in log space
+            index = point_index(x,y)
             h = list()
-            def onpick3(event):
+            def onclick(event):
+                if event.inaxes is not ax or event.xdata is None:
+                    return
                 for handle in h:
                     handle.remove()
                 h.clear()
-                for ind in event.ind:
-                    h.append(ax.text(x[ind],y[ind],labels[ind]))
-                    plt.draw()
-                    plt.show(block=False)
-                    
-        #scatter = ax.scatter(x,y,s*markersize,c,marker=mrk,vmin=1,vmax=8,
-        #                     label=label,cmap=plt.cm.jet,picker=tooltips)            
-        scatter = ax.scatter(x,y,s*markersize,c,marker=mrk,vmin=vmin,vmax=vmax,
-                             label=label,cmap=plt.cm.jet,picker=tooltips)            
-
-        if tooltips:
-            fig.canvas.mpl_connect('pick_event', onpick3)
+                corner = ax.transData.inverted().transform((event.x + self.tooltip_pixels,
+                                                            event.y + self.tooltip_pixels))
+                ind = index.query(event.xdata,event.ydata,corner[0],corner[1])
+                if ind >= 0:
+                    label = self.get_values('functioncallsitesandloops',rows[ind:ind+1])[0]
+                    h.append(ax.text(x[ind],y[ind],label))
+                fig.canvas.draw_idle()
+
+            fig.canvas.mpl_connect('button_press_event', onclick)
             
         ax.set_yscale('log')
         ax.set_xscale('log')
@@ -295,7 +2060,9 @@ class advisor_results():
         
         #plt.hlines(y=5.4235e1,xmin=0,xmax=1)
         
-        plt.show(block=False)
+        with instrument_stage('show'):
+            if show:
+                plt.show(block=False)
 
         return scatter
 
@@ -303,17 +2070,13 @@ class advisor_results():
         """
         Calculate the sum of any field over all the loops. NOTE: there may be loops in the list
         that are not actually executed by the program and therefore the result may be an overestimation.
-        For example, for FLOPS a better number is given in the Advisor GUI summary page.
+        For example, for FLOPS a better number is given in the Advisor GUI summary page. The self times
+        of children are also added to the ones of their parents; group_by counts each of them once.
         """
 
-        tot = 0
-        for elem in self.data[key]:
-            felem = convert_to_float(elem)
-            if not felem is None:
-                tot = tot + felem
-        return tot
+        return self.store.get_sum(key)
 
-    def loop_filter(self,loop,filterVal=None,filterKey=None,filterOp=None):
+    def loop_filter(self,loop,filterVal=None,filterKey=None,filterOp=None,where=None):
         """
         This function returns if the loop passes or not the filter
 
@@ -323,10 +2086,14 @@ class advisor_results():
         filterVal: list of values for the filter
         filterKey: list of keys for the loops to consider for the filtering process
         filterOp: filter operation defined as a function comparing attributes from filterKey with values in filterVal
+        where: condition the loop has to pass
         --------
 
         """
 
+        if not where is None and not where.mask(self.store)[loop._row]:
+            return [False]
+
         if filterOp == None: return [True]
 
         if not type(filterVal) is list:
@@ -348,15 +2115,125 @@ class advisor_results():
         return filter_pass
 
 
-    def get_array(self,key,include_children=True,filterVal=None,filterKey=None,filterOp=None):
+    @instrumented('get_array')
+    def get_array(self,key,include_children=True,filterVal=None,filterKey=None,filterOp=None,where=None):
         """
         Return an array collected from all the loops of a single value specified by key.
         Filter results by passing filterVal, filterKey and filterOp to compare the value
         in loop.filterKey to filterVal using operator filterOp. Use import operator to
-        pass operators.
+        pass operators. Alternatively, pass a condition object in where, which is evaluated
+        on whole columns at once.
+        """
+
+        rows = self.get_rows(include_children=include_children,
+                             filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+        instrument_rows(len(rows))
+
+        return self.get_values(key,rows)
+
+    @instrumented('get_values')
+    def get_values(self,key,rows):
+        """
+        Return the values of the column key for the rows returned by get_rows or where.
+        """
+
+        # The gain estimate of a child is the one of its parent
+        if key == 'gainestimate':
+            rows = self.tree.top[rows]
+
+        return self.store.get_array(key,rows)
+
+    def get_typed(self,key,rows=None):
+        """
+        Return the cells of the column key for the rows returned by get_rows or where (default all the
+        rows) parsed according to their type, see column_store.get_typed.
+        """
+
+        if rows is None:
+            return self.store.get_typed(key)
+
+        # The gain estimate of a child is the one of its parent
+        if key == 'gainestimate':
+            rows = self.tree.top[rows]
+
+        return self.store.get_typed(key,rows)
+
+    def get_floats(self,key,rows,fill=np.nan):
+        """
+        Return the values of the column key for the given rows as a float array, with fill in
+        the cells that can't be converted.
+        """
+
+        if key == 'gainestimate':
+            rows = self.tree.top[rows]
+
+        values,valid = self.store.get_float(key,rows)
+        return np.where(valid,values,fill)
+
+    def where(self,*conditions,include_children=True,**terms):
+        """
+        Return the rows of the loops passing all the conditions and the condition built from terms,
+        with the same parent/child rules as get_array. Use get_values to retrieve the columns.
+
+        Example: rows = adv.where(file='current_deposition.F90',line__in=[2681,2730,9552],selftime__gt=0.01)
+                 ai = adv.get_values('ai',rows)
+        """
+
+        cond = condition(**terms)
+        for c in conditions:
+            cond = cond & c
+
+        return self.get_rows(include_children=include_children,where=cond)
+
+    @instrumented('get_rows')
+    def get_rows(self,include_children=True,filterVal=None,filterKey=None,filterOp=None,where=None,
+                 sort_by=None,descending=False):
+        """
+        Return the rows of the store of the loops used by get_array, in the order of the list of loops,
+        or sorted by the keys sort_by (see argsort) with children following their parents.
+        Loops that have data are used first, if a loop doesn't have data its children that have data
+        are used instead.
         """
+
+        # Look at loops that have data first
+        mask = self.tree.has_data & ~self.tree.is_child
         
-        l = list()
+        # If loop didn't have data, go through its children (that have data)
+        if include_children:
+            mask |= self.tree.has_data & self.tree.is_child & ~self.tree.ancestor_has_data
+
+        mask = self.filter_mask(mask,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+
+        order = self._order if sort_by is None else self._sorted_order(sort_by,descending)
+
+        return order[mask[order]]
+
+    def _sorted_order(self,keys,descending):
+        """
+        Return all the rows of the store sorted as argsort, each loop being followed by its children
+        """
+
+        signature = ('rows',) + sort_keys(keys,descending)
+        order = self._sort_cache.get(signature)
+        if order is None:
+            rank = np.zeros(self.store.nrows,dtype=np.int64)
+            rank[self.argsort(keys,descending)] = np.arange(np.count_nonzero(~self.tree.is_child))
+            order = np.argsort(rank[self.tree.top],kind='stable')
+            order.setflags(write=False)
+            self._sort_cache[signature] = order
+
+        return order
+
+    def filter_mask(self,mask,filterVal=None,filterKey=None,filterOp=None,where=None):
+        """
+        Return a copy of the boolean array mask over the rows of the store where only the rows that pass
+        the filters are left. The filterOp functions are only called for the rows that are True in mask.
+        """
+
+        mask = mask.copy()
+
+        if not where is None:
+            mask &= where.mask(self.store)
 
         if not type(filterVal) is list:
             filterVal = [filterVal]
@@ -365,178 +2242,135 @@ class advisor_results():
         if not type(filterOp) is list:
             filterOp  = [filterOp ]
 
-        filter_pass = [False for i in range(np.size(filterOp))]
-
-        # Go through all the loops
-        for loop in self.loops:
-            # Look at loops that have data first
-            if(loop.has_data()):
-
-                # Go through all the filters
+        # Go through all the filters
+        if not filterOp[0] is None:
+            for row in np.flatnonzero(mask):
                 for i,op in enumerate(filterOp):
                     try:
-                        filter_pass[i] = op(getattr(loop,filterKey[i]),filterVal[i])
+                        filter_pass = op(self.store.get_raw(filterKey[i])[row],filterVal[i])
                     except TypeError:
-                        filter_pass[i] = False
+                        instrument_count('filter_errors')
+                        filter_pass = False
+                    if not filter_pass:
+                        mask[row] = False
+                        break
 
-                # Check if all filters pass
-                if filterOp[0] is None or all(filter_pass):
-        
-                    elem = getattr(loop,key)
-                    felem = convert_to_float(elem)
-                    if not felem is None:
-                        l.append(felem)
-                    else:
-                        l.append(elem)
-
-            # If loop didn't have data, go through its children (that have data)
-            elif(include_children and loop.child_has_data()):
-                for child in loop.children:
-                    if child.has_data():
-
-                        # Go through all the filters for the child
-                        for i,op in enumerate(filterOp):
-                            try:
-                                filter_pass[i] = op(getattr(child,filterKey[i]),filterVal[i])
-                            except TypeError:
-                                filter_pass[i] = False
-
-                        # Check if all filters pass for the child
-                        if filterOp[0] is None or all(filter_pass):
-                            if key is 'gainestimate':
-                                elem = getattr(loop,key)
-                            else:
-                                elem = getattr(child,key)
-                            felem = convert_to_float(elem)
-                            if not felem is None:
-                                l.append(felem)
-                            else:
-                                l.append(elem)
-  
-        arr = np.array(l)
-
-        return arr
-
-    def print_loop_properties(self,include_children=True,has_data=True,filterVal=None,filterKey=None,filterOp=None):
-        """
-        Print all the loops/functions and their properties in the terminal.
+        return mask
+
+    @instrumented('print_loop_properties')
+    def print_loop_properties(self,include_children=True,has_data=True,filterVal=None,filterKey=None,filterOp=None,where=None,
+                              output=None,fmt='text',page_size=1000):
+        """
+        Print all the loops/functions and their properties in the terminal, a pager or a file. Each loop
+        is printed once, followed by its children. The table is written in pages (see loop_table).
 
         For filter examples, see print_advisor_example.py
 
         Input:
         ---------
         include_children: if True, includes the children loops
-        has_data: if True, only includes
+        has_data: if True, only includes the loops with data and the loops with children with data
         filterVal: list of values for the filter
         filterKey: list of keys for the loops to consider for the filtering process
         filterOp: filter operation defined as a function comparing attributes from filterKey with values in filterVal
+        where: condition the loops have to pass
+        output: None for the terminal, 'pager' for the pager in $PAGER (default less), a file name or a file object
+        fmt: 'text' (fixed width), 'markdown' or 'csv'; only the text format has the summary before the table
+        page_size: number of rows written at once
         ---------
-        """
 
-        # Count loops
-        nloops = 0
-        nloops_with_filters = 0
+        Output:
+        ---------
+        loop_table of the printed loops
+        ---------
+        """
 
-        # Go through all the loops
-        for loop in self.loops:
-            
-            # Look at loops that have data first
-            if(has_data and loop.has_data() or not has_data or (include_children and loop.child_has_data())):
-                
-                nloops += 1
-                filter_pass = self.loop_filter(loop,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-                if ((has_data)and(all(filter_pass))): nloops_with_filters += 1
-
-            # If loop didn't have data, go through its children (that have data)
-            if(include_children):
-                if loop.child_has_data() or not has_data:
-
-                    for child in loop.children:
-                        nloops += 1
-                        if (has_data):
-                            filter_pass = self.loop_filter(loop,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-                            if (child.has_data()and(all(filter_pass))): nloops_with_filters += 1
-                        else:
-                            nloops_with_filters += 1
-
-        # Print information
-        print(' ')
-        print(' Total number of loops: {0}'.format(nloops))
-        print(' Total number of loops with filters: {0}'.format(nloops_with_filters))
-
-        print(' ')
-        print(' Filters:')
-        if (include_children):
-            print(' - children are included')
-        else:
-            print(' - children not included')
-        if (has_data):
-            print(' - loops with data')
+        table,nloops = self.loop_table(include_children=include_children,has_data=has_data,
+                                       filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+        instrument_rows(len(table))
+
+        if output is None:
+            fh,close = sys.stdout,None
+        elif output == 'pager':
+            pager = subprocess.Popen(os.environ.get('PAGER','less'),shell=True,stdin=subprocess.PIPE,text=True)
+            fh,close = pager.stdin,pager
+        elif isinstance(output,str):
+            fh,close = open(output,mode='w',buffering=1 << 20),None
         else:
-            print(' - All loops')
-
-        print(' ')
-        print(' List of objects:')
-        print('')
-        print(' {0:3.3} type      {1:^30.30} {2:^30.30} {3:^10.10} {4:^10.10} {5:^10.10} {6:^10.10}'.format('id','subroutine','file','line','AI','gflops','time'))
-        print(' ------------------------------------------------------------------------------------------------------------------')
-
-        default = -999
-        
-        # Go through all the loops
-        for loop in self.loops:
-
-            if 'Function' in loop.type:
-                formatstr_parent = '     Function: {0:67.30} {3:>10.10} {4:>10.10} {5:>10.10}'
-                loopName = loop.functioncallsitesandloops
-            else:
-                formatstr_parent = ' {6:3.3} Loop:     {0:30.30} {1:>30.30} {2:>10} {3:>10.10} {4:>10.10} {5:>10.10}'
-                loopName = loop.subroutine
-                
-            formatstr_child  = ' {6:3.3}  | Child: {0:30.30} {1:>30.30} {2:>10} {3:>10.10} {4:>10.10} {5:>10.10}'
-            
-            # Look at loops that have data first
-            if((has_data)and(loop.has_data()) or not has_data or (include_children and loop.child_has_data())):
-
-                filter_pass = self.loop_filter(loop,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-
-                # Check if all filters pass
-                if all(filter_pass):
-                    if (getattr(loop,'selftimes',default) == default):
-                        print(formatstr_parent.format(loopName,loop.file,loop.line,loop.ai,loop.gflops,loop.selftime,loop.id))
-                    else:
-                        print(formatstr_parent.format(loopName,loop.file,loop.line,loop.ai,loop.gflops,loop.selftimes,loop.id))
-
-                if ((include_children)and(loop.has_children)):
-
-                    # Go through all the children
-                    for child in loop.children:
+            fh,close = output,None
+
+        try:
+            if fmt == 'text':
+                lines = [' ',
+                         ' Total number of loops: {0}'.format(nloops),
+                         ' Total number of loops with filters: {0}'.format(len(table)),
+                         ' ',
+                         ' Filters:',
+                         ' - children are included' if include_children else ' - children not included',
+                         ' - loops with data' if has_data else ' - All loops',
+                         ' ',
+                         ' List of objects:',
+                         '']
+                fh.write('\n'.join(lines) + '\n')
+            table.write(fh,fmt=fmt,page_size=page_size)
+        except BrokenPipeError:
+            # The pager was closed before the end of the table
+            pass
+        finally:
+            if isinstance(close,subprocess.Popen):
+                try:
+                    fh.close()
+                except BrokenPipeError:
+                    pass
+                close.wait()
+            elif isinstance(output,str) and output != 'pager':
+                fh.close()
+
+        return table
+
+    @instrumented('loop_table')
+    def loop_table(self,include_children=True,has_data=True,filterVal=None,filterKey=None,filterOp=None,where=None):
+        """
+        Return the loop_table of print_loop_properties and the number of loops before the filters.
+        Children of any depth are listed, each loop is followed by all its descendants in file order.
+        """
 
-                        if(((has_data)and(child.has_data())) or not(has_data)):
+        tree = self.tree
+        children = tree.is_child if include_children else np.zeros(self.store.nrows,dtype=bool)
 
-                            filter_pass = self.loop_filter(child,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-                            if all(filter_pass):
-                                print(formatstr_child.format(child.subroutine,child.file,child.line,child.ai,child.gflops,child.selftime,child.id))                                    
+        if has_data:
+            # Loops that have data or that have children with data, and children that have data
+            selected = tree.has_data | (include_children & tree.child_has_data)
+            shown = tree.has_data
+            child_block = tree.child_has_data
+        else:
+            selected = np.ones(self.store.nrows,dtype=bool)
+            shown = selected
+            child_block = selected
+        selected = selected & ~tree.is_child
 
+        # Children are printed after their parent if the parent is printed or has children with data
+        candidates = selected | (children & shown & (selected | child_block)[tree.parent])
 
-            # If loop didn't have data, go through its children (that have data)
-            if(include_children):
-                if loop.child_has_data() or not has_data:
+        # Filters are only evaluated on the rows that can be printed
+        passed = self.filter_mask(candidates,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
 
-                    # Go through all the children
-                    for child in loop.children:
-                        if (((has_data)and(child.has_data())) or not(has_data)):
+        # Each loop is followed by its descendants
+        rows = np.flatnonzero(passed)
+        rows = rows[np.lexsort((rows,self._rank[tree.top[rows]]))]
 
-                            filter_pass = self.loop_filter(child,filterVal=filterVal,filterKey=filterKey,filterOp=filterOp)
-                            if all(filter_pass):
-                                print(formatstr_child.format(child.subroutine,child.file,child.line,child.ai,child.gflops,child.selftime,child.id))                       
+        kinds = np.where(tree.is_child[rows],'Child','Loop').astype(object)
+        types = self.store.get_raw('type',rows)
+        kinds[~tree.is_child[rows] & np.array(['Function' in t for t in types],dtype=bool)] = 'Function'
 
+        return loop_table(self.store,rows,kinds),np.count_nonzero(candidates)
 
     def parse_functioncallsitesandloops(self,fcsal,vals,keys):
         """
         This method parses the child property, the subroutine, the file and the line number 
         from the functioncallsitesandloops parameter and add these properties as attributes to loop.
         Values and keys are added to existing list vals and keys given in arguments.
+        See parse_locations for the parsing of whole columns.
 
         Inputs:
         -------
@@ -546,53 +2380,244 @@ class advisor_results():
         -------        
         """
 
-        # functioncallsitesandloops
-        child = False
-        subroutine = 'None'
-        file = 'None'
-        line = ''
+        child,subroutine,file,line = parse_location(fcsal)[:4]
 
-        # Get the child property
-        if fcsal[1:6] == 'child':
-            child = True
-            fcsal = fcsal[17:-1]
-        else:
-            fcsal = fcsal[9:-1]
+        vals.append(child)
+        vals.append(subroutine)
+        vals.append(file)
+        vals.append(line)
 
-        # Get the subroutine that contains the loop
-        if (' at ' in fcsal):
-            fcsal = fcsal.split(' at ')
-            subroutine = fcsal[0]
+        return vals,keys
 
-            # Get the file
-            try:
-                fcsal = fcsal[1].split(':')
-            except :
-                print(' Problem with loop format')
-                print(fcsal,'\n')
+    def get_locations(self):
+        """
+        Return the locations parsed from the function call sites and loops column, see parse_locations
+        """
+        return parse_locations(self.store.get_raw('function call sites and loops'))
 
-            file = fcsal[0]
+    def malformed_locations(self):
+        """
+        Return the rows of the store whose function call sites and loops cell could not be parsed
+        """
+        return np.flatnonzero(self.get_locations()['malformed'])
 
-            # get the line number
-            line = int(fcsal[1])
+    def sort(self,attr='file',descending=False):
+        """
+        Sort the list of loops according to the specified attribute(s), see argsort. The loops with
+        equal values stay in the order of the report, sort(None) restores the order of the report.
+        The data in the store is not reordered.
 
-        vals.append(child)
-        vals.append(subroutine)
-        vals.append(file)
-        vals.append(convert_to_int(line))
+        Inputs:
+        -------
+        attr       : string or list of strings - attribute(s) to be used for sorting, the first one first
+        descending : boolean or list of booleans - sort in descending order, per attribute if a list
 
-        return vals,keys
+        """
 
-    def sort(self,attr='file'):
+        if attr is None:
+            self.loops = list(self._report_loops)
+        else:
+            # Sorting is stable, so successive sorts can be chained
+            current = np.array([loop._row for loop in self.loops],dtype=np.int64)
+            keys,descending = sort_keys(attr,descending)
+            rows = current[self._lexsort(current,keys,descending)]
+            positions = np.searchsorted(np.flatnonzero(~self.tree.is_child),rows)
+            self.loops = [self._report_loops[i] for i in positions.tolist()]
+        self._build_order()
+
+    def argsort(self,keys,descending=False):
         """
-        Sort the list of loops according to the specified attribute.
+        Return the rows of the store of the loops that are not children, sorted by one or more keys,
+        without changing the order of the list of loops. Cells that can be converted to numbers are
+        compared as numbers and come before the other cells, which are compared as text, so 'selftime'
+        sorts by time. Loops with equal values stay in the order of the report. The result is cached
+        per keys, so sorting again by the same keys costs nothing.
 
         Inputs:
         -------
-        attr : string - attribute to be used for sorting
+        keys       : string or list of strings - keys to sort by, the first one first
+        descending : boolean or list of booleans - sort in descending order, per key if a list
+        -------
+        """
+
+        signature = sort_keys(keys,descending)
+        order = self._sort_cache.get(signature)
+        if order is None:
+            rows = np.flatnonzero(~self.tree.is_child)
+            order = rows[self._lexsort(rows,*signature)]
+            order.setflags(write=False)
+            self._sort_cache[signature] = order
+
+        return order
+
+    def _lexsort(self,rows,keys,descending):
+        """
+        Return the stable permutation sorting rows by the keys, see argsort
+        """
+
+        # np.lexsort sorts by the last array first
+        columns = list()
+        for key,desc in zip(keys[::-1],descending[::-1]):
+            values,valid = self.store.get_float(key,rows)
+            text = np.unique(self.store.get_raw(key,rows).astype(str),return_inverse=True)[1].ravel()
+            values = np.where(valid,values,0.0)
+            if desc:
+                text,values = -text,-values
+            columns += [text,values,~valid]
+
+        if len(columns) == 0:
+            return np.arange(len(rows))
+        return np.lexsort(columns)
+
+    def loop_ids(self):
+        """
+        Return the identity of the loop of every row of the store, used to match loops between reports.
+        The identity is the tuple (subroutine,file,line,occurrence,kind,child occurrence):
+        occurrence counts the previous loops at the same location, kind is the type of a child
+        without the [Not Executed] mark ('' for loops that are not children, joined with '/' to the
+        kind of its parent for deeper children) and child occurrence counts the previous children of
+        the same parent with the same kind.
+        """
+
+        subroutine = self.store.get_raw('subroutine')
+        file = self.store.get_raw('file')
+        line = self.store.get_raw('line')
+        types = self.store.get_raw('type') if self.store.has_key('type') else np.full(self.store.nrows,'',dtype=object)
+
+        ids = list()
+        counts = dict()
+        for row in range(self.store.nrows):
+            parent = self.tree.parent[row]
+            if parent < 0:
+                location = (subroutine[row],file[row],line[row])
+                n = counts.get(location,0)
+                counts[location] = n + 1
+                ids.append(location + (n,'',0))
+            else:
+                kind = types[row].replace('[Not Executed]','').strip()
+                if ids[parent][4] != '':
+                    kind = ids[parent][4] + '/' + kind
+                key = (ids[parent],kind)
+                m = counts.get(key,0)
+                counts[key] = m + 1
+                ids.append(ids[parent][:4] + (kind,m))
+
+        return ids
+
+# ___________________________________________________________________
+#
+# Aggregation
+# ___________________________________________________________________
+
+    def group_by(self,by=None,keys=['selftime','totaltime','gflop'],filterVal=None,filterKey=None,filterOp=None,where=None):
+        """
+        Sum columns over the loops grouped by the values of a column, e.g. the self time per file. Unlike
+        get_sum, each part of a loop is counted once: the value of a row is only used if none of its
+        ancestors has a value for that key (see loop_tree.owned). The rows of a group are the loops with
+        that value; children without a value of the grouping column take the one of their outermost
+        ancestor. Note that total times of nested loops overlap, so only self times add up to the run time.
+
+        Input
+        ------
+        by    : key of the grouping column, e.g. 'file', 'subroutine', 'module', 'vectorisa' or
+                'whynovectorization?' (default None, a single group '' with all the loops)
+        keys  : keys of the columns to sum (default selftime, totaltime and gflop)
+        filterVal, filterKey, filterOp, where: see get_array, applied to each row
+        ------
+
+        Output
+        ------
+        dictionary of arrays with one element per group, sorted by group: 'groups' (values of the grouping
+        column), 'count' (number of loops that are not children) and the sums of the keys. If both
+        selftime and gflop are summed, 'gflops' is their ratio (NaN for groups without time).
+        ------
+        """
+
+        n = self.store.nrows
+        mask = self.filter_mask(np.ones(n,dtype=bool),filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+
+        if by is None:
+            labels = np.zeros(n,dtype=object)
+            labels[:] = ''
+        else:
+            labels = self.store.get_raw(by)
+            empty = np.array([len(str(label)) == 0 for label in labels],dtype=bool)
+            labels = np.where(empty,labels[self.tree.top],labels)
+        groups,inverse = np.unique(labels.astype(str),return_inverse=True)
+        inverse = inverse.ravel()
+
+        result = {'groups':groups.astype(object),
+                  'count':np.bincount(inverse[mask & ~self.tree.is_child],minlength=len(groups))}
 
+        for key in keys:
+            values,valid = self.store.get_float(key)
+            used = mask & self.tree.owned(valid)
+            result[key] = np.bincount(inverse[used],weights=values[used],minlength=len(groups))
+
+        if 'selftime' in keys and 'gflop' in keys:
+            with np.errstate(invalid='ignore',divide='ignore'):
+                result['gflops'] = np.where(result['selftime'] > 0,result['gflop'] / result['selftime'],np.nan)
+
+        return result
+
+    def top(self,n=20,key='selftime',by=None,share=None,filterVal=None,filterKey=None,filterOp=None,where=None):
+        """
+        Return the n loops or groups with the largest values of key, e.g. the 20 files with the most self
+        time. Only the n largest values are sorted (np.argpartition). With share, e.g. 0.9, return instead
+        the smallest number of groups whose values add up to that share of the total, e.g. the files
+        that own 90% of the time.
+
+        Input
+        ------
+        n     : integer - number of loops or groups (default 20)
+        key   : key of the column to rank by (default 'selftime')
+        by    : key of the grouping column (see group_by), or None to rank the loops (default None)
+        share : float - share of the total to reach instead of n (default None)
+        filterVal, filterKey, filterOp, where: see get_array
+        ------
+
+        Output
+        ------
+        dictionary of arrays sorted by decreasing value: 'rows' (rows of the store of the loops, without
+        by) or 'groups' (with by), key (the values), 'fraction' (share of the total of each) and
+        'cumulative' (running sum of fraction). Without by, the loops are the ones that are not children,
+        with the values of their children counted as in group_by.
+        ------
         """
-        self.loops= sorted(self.loops, key=lambda loop: getattr(loop,attr))
+
+        if by is None:
+            # Loops that are not children, with the values of their owned rows summed over the loop
+            values,valid = self.store.get_float(key)
+            mask = self.filter_mask(np.ones(self.store.nrows,dtype=bool),
+                                    filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+            used = mask & self.tree.owned(valid)
+            totals = np.bincount(self.tree.top[used],weights=values[used],minlength=self.store.nrows)
+            names,items = 'rows',np.flatnonzero(~self.tree.is_child)
+            values = totals[items]
+            total = values.sum()
+        else:
+            grouped = self.group_by(by=by,keys=[key],filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+            names,items,values = 'groups',grouped['groups'],grouped[key]
+            total = values.sum()
+
+        if share is None:
+            n = min(n,len(values))
+            best = np.argpartition(-values,n-1)[:n] if n > 0 else np.zeros(0,dtype=np.int64)
+            best = best[np.argsort(-values[best],kind='stable')]
+        else:
+            best = np.argsort(-values,kind='stable')
+
+        fraction = values[best] / total if total > 0 else np.zeros(len(best))
+        cumulative = np.cumsum(fraction)
+
+        if not share is None:
+            n = min(int(np.searchsorted(cumulative,share - 1e-12)) + 1,len(best))
+            best,fraction,cumulative = best[:n],fraction[:n],cumulative[:n]
+
+        return {names:items[best],
+                key:values[best],
+                'fraction':fraction,
+                'cumulative':cumulative}
 
 # ___________________________________________________________________
 #
@@ -617,21 +2642,210 @@ class advisor_results():
         ylim = np.array(ax.get_ylim())
 
         if not roofs is None:
-            for bw in [roofs['DRAM Bandwidth'],roofs['L2 Bandwidth'],roofs['L1 Bandwidth']]:
-                for flops in [roofs['Scalar Add Peak'], roofs['DP Vector Add Peak'], roofs['DP Vector FMA Peak']]:
-                    y = np.minimum(np.ones(len(x)) * flops , x * bw)
-                    ax.plot(x,y,color='k',ls='-',lw='2')
-        else:        
-            for bw in [dram_bandwidth,mcdram_bandwidth]:
-                if bw != None:
-                    if scalar_gflops != None:
-                        y = np.minimum(np.ones(len(x)) * scalar_gflops , x * bw)
-                        ax.plot(x,y,color='k',ls='-',lw='2')
-                    if dp_vect_gflops != None:
-                        y = np.minimum(np.ones(len(x)) * dp_vect_gflops , x * bw)
-                        ax.plot(x,y,color='k',ls='-',lw='2')
+            model = roofline_model(dict((key,roofs[key]) for key in ['DRAM Bandwidth','L2 Bandwidth','L1 Bandwidth']),
+                                   dict((key,roofs[key]) for key in ['Scalar Add Peak','DP Vector Add Peak','DP Vector FMA Peak']))
+        else:
+            bandwidths = [('dram',dram_bandwidth),('mcdram',mcdram_bandwidth)]
+            peaks = [('scalar',scalar_gflops),('dp_vect',dp_vect_gflops)]
+            model = roofline_model(dict((name,bw) for name,bw in bandwidths if bw != None),
+                                   dict((name,flops) for name,flops in peaks if flops != None))
+
+        if len(model.bandwidths) > 0 and len(model.peaks) > 0:
+            ax.plot(x,model.curves(x).T,color='k',ls='-',lw='2')
+
+    def classify_roofs(self,model,include_children=True,filterVal=None,filterKey=None,filterOp=None,where=None):
+        """
+        Find the binding roof of the loops used by get_array (see roofline_model.classify) and how far
+        they are from it.
+
+        Input
+        ------
+        model            : roofline_model object
+        include_children, filterVal, filterKey, filterOp, where: see get_array
+        ------
+
+        Output
+        ------
+        dictionary of arrays with keys 'rows' (rows of the store), 'ai', 'gflops', 'roof' (name of the
+        binding roof), 'ceiling' (GFLOPS of the binding roof at the AI of the loop), 'percent' (percentage
+        of the binding roof reached) and 'attainable' (GFLOPS under the highest roofs)
+        ------
+        """
+
+        rows = self.get_rows(include_children=include_children,
+                             filterVal=filterVal,filterKey=filterKey,filterOp=filterOp,where=where)
+        ai = self.store.get_float('ai',rows)[0]
+        gflops = self.store.get_float('gflops',rows)[0]
+
+        roof,ceiling,percent = model.classify(ai,gflops)
+        names = np.array(model.names + [''],dtype=object)
+
+        return {'rows':rows,
+                'ai':ai,
+                'gflops':gflops,
+                'roof':names[roof],
+                'ceiling':ceiling,
+                'percent':percent,
+                'attainable':model.attainable(ai)}
 
 
+# ___________________________________________________________________
+#
+# Comparison of reports
+# ___________________________________________________________________
+
+class report_diff():
+    """
+    This is a class for storing the result of diff. Matched loops are stored as pairs of rows of the
+    two stores in rows1 and rows2, with their labels. For each compared key, the values in both
+    reports are stored in values1[key] and values2[key] and their difference in delta[key], NaN
+    where a value can't be converted. Rows of loops found in only one of the reports are stored in
+    only1 and only2. has_data is True for the pairs where both loops have data.
+    """
+
+    def __init__(self,adv1,adv2,rows1,rows2,keys):
+
+        self.rows1 = rows1
+        self.rows2 = rows2
+        self.labels = adv1.store.get_raw('function call sites and loops',rows1)
+        self.has_data = adv1.tree.has_data[rows1] & adv2.tree.has_data[rows2]
+
+        self.only1 = np.setdiff1d(np.arange(adv1.store.nrows),rows1)
+        self.only2 = np.setdiff1d(np.arange(adv2.store.nrows),rows2)
+
+        self.values1 = dict()
+        self.values2 = dict()
+        self.delta = dict()
+        for key in keys:
+            self.values1[key] = adv1.get_floats(key,rows1)
+            self.values2[key] = adv2.get_floats(key,rows2)
+            self.delta[key] = self.values2[key] - self.values1[key]
+
+    def get_delta(self,key,has_data=True):
+        """
+        Return the difference of the values of key between the second and the first report for the
+        matched loops, only for the pairs where both loops have data if has_data is True.
+        """
+        if has_data:
+            return self.delta[key][self.has_data]
+        return self.delta[key]
+
+class rank_results():
+    """
+    This is a class for storing the per-rank reports of an MPI run aligned loop by loop, made by load_ranks.
+    Loops are matched across ranks by their identity (see advisor_results.loop_ids) and stored in columns:
+    rows[i,k] is the row of loop k in the report of rank ranks[i], -1 if the rank doesn't have the loop.
+    For each key, values[key] is the (ranks x loops) array of the values, NaN where a rank doesn't have the
+    loop or the cell can't be converted, and min[key], mean[key], max[key] and imbalance[key] (max/mean - 1)
+    are computed over the ranks. has_data is True for the loops that have data in any rank.
+    """
+
+    def __init__(self,reports,keys):
+
+        self.reports = reports
+        self.ranks = np.array([i if adv.rank is None else adv.rank for i,adv in enumerate(reports)],dtype=np.int64)
+
+        # Column of each loop identity, in the order they are first seen
+        index = dict()
+        columns = list()
+        for adv in reports:
+            columns.append(np.array([index.setdefault(lid,len(index)) for lid in adv.loop_ids()],dtype=np.int64))
+        self.ids = list(index)
+        nloops = len(self.ids)
+
+        self.rows = np.full((len(reports),nloops),-1,dtype=np.int64)
+        self.has_data = np.zeros(nloops,dtype=bool)
+        self.labels = np.empty(nloops,dtype=object)
+        for i,(adv,column) in enumerate(zip(reports,columns)):
+            self.rows[i,column] = np.arange(adv.store.nrows)
+            self.has_data[column] |= adv.tree.has_data
+            self.labels[column] = adv.store.get_raw('function call sites and loops')
+
+        self.values = dict()
+        self.min = dict()
+        self.mean = dict()
+        self.max = dict()
+        self.imbalance = dict()
+        for key in keys:
+            values = np.full((len(reports),nloops),np.nan)
+            for i,(adv,column) in enumerate(zip(reports,columns)):
+                if adv.store.has_key(key):
+                    v,ok = adv.store.get_float(key)
+                    values[i,column] = np.where(ok,v,np.nan)
+            self.values[key] = values
+
+            # Loops without values in any rank are NaN
+            counts = np.count_nonzero(~np.isnan(values),axis=0)
+            filled = np.where(np.isnan(values),0.0,values)
+            with np.errstate(invalid='ignore',divide='ignore'):
+                self.mean[key] = np.where(counts > 0,filled.sum(axis=0) / counts,np.nan)
+                self.min[key] = np.where(counts > 0,np.where(np.isnan(values),np.inf,values).min(axis=0),np.nan)
+                self.max[key] = np.where(counts > 0,np.where(np.isnan(values),-np.inf,values).max(axis=0),np.nan)
+                self.imbalance[key] = np.where(self.mean[key] > 0,self.max[key] / self.mean[key] - 1.0,np.nan)
+
+    def get_stats(self,key,has_data=True):
+        """
+        Return the min, mean, max and imbalance of key over the ranks, only for the loops with data if has_data is True
+        """
+        mask = self.has_data if has_data else np.ones(len(self.ids),dtype=bool)
+        return self.min[key][mask],self.mean[key][mask],self.max[key][mask],self.imbalance[key][mask]
+
+def load_ranks(paths,keys=['selftime','gflops'],workers=None,cache=True):
+    """
+    Read the per-rank reports of an MPI run in parallel (see advisor_results.load_many) and align their
+    loops. The rank of each report is read from the 'MPI rank:' line of its preamble, or else is its
+    position in paths.
+
+    Inputs:
+    -------
+    paths   : list of advisor report files, one per rank
+    keys    : list of keys to compare across the ranks
+    workers : number of worker processes (default: number of cores)
+    cache   : if True, the workers read and write the binary caches of the reports
+    -------
+
+    Output:
+    -------
+    rank_results object
+    -------
+    """
+
+    reports = advisor_results.load_many(paths,workers=workers,cache=cache)
+    order = np.argsort([i if adv.rank is None else adv.rank for i,adv in enumerate(reports)],kind='stable')
+
+    return rank_results([reports[i] for i in order],keys)
+
+def diff(adv1,adv2,keys=['ai','gflops','selftime','gainestimate']):
+    """
+    Match the loops of two reports by their identity (see advisor_results.loop_ids) and compute the
+    difference of the values of keys for each pair of matched loops. Loops are matched with a hash
+    index, in linear time, and children are matched by kind rather than by position.
+
+    Inputs:
+    -------
+    adv1 : advisor_results - first report
+    adv2 : advisor_results - second report
+    keys : list of keys to compare
+    -------
+
+    Output:
+    -------
+    report_diff object
+    -------
+    """
+
+    index = dict((lid,row) for row,lid in enumerate(adv2.loop_ids()))
+
+    rows1 = list()
+    rows2 = list()
+    for row,lid in enumerate(adv1.loop_ids()):
+        match = index.get(lid)
+        if not match is None:
+            rows1.append(row)
+            rows2.append(match)
+
+    return report_diff(adv1,adv2,np.array(rows1,dtype=np.int64),np.array(rows2,dtype=np.int64),keys)
+
 # ___________________________________________________________________
 #
 # Internal functions
@@ -640,19 +2854,374 @@ class advisor_results():
 def convert_to_float(elem):
     """
     Try to convert an element in string elem to a floating point. Check for some special cases like
-    time values ending in 's'. On failure return None.
+    time values ending in 's'. On failure return None. Strings are matched with the number regular
+    expression first, so that cells that are not numbers don't raise exceptions.
+    """
+    if not isinstance(elem,str):
+        try:
+            return float(elem)
+        except (TypeError,ValueError):
+            return None
+    if number.match(elem):
+        return float(elem)
+    if len(elem) > 0 and elem[-1] in 'sx' and number.match(elem[:-1]):
+        return float(elem[:-1])
+    return None
+
+def convert_cell(elem,kind='number'):
+    """
+    Convert a cell of a column of type kind (see column_types) to a float, or return None if the cell has
+    no value. Cells that convert_to_float can't convert are parsed with parse_cell, so that upper bounds
+    ('< 0.0001s', the value is the bound), percentages ('48.2%') and pairs ('8; [8]', the value of the
+    loop body) have a value. Lists have no value.
+    """
+    value = convert_to_float(elem)
+    if value is None and kind != 'list' and isinstance(elem,str):
+        value = parse_cell(elem,kind)['values']
+        if np.isnan(value):
+            return None
+    return value
+
+def parse_cell(cell,kind):
+    """
+    Parse a cell of a column of type kind (see column_types) into a dictionary with its value, flags and,
+    for pairs and lists, its remainder and items. Used by column_store.get_typed.
+    """
+
+    flags = 0
+    text = cell
+    if '<' in text and '>' in text:
+        stripped = markup.sub('',text)
+        if stripped != text:
+            flags |= flag_markup
+            text = stripped
+    text = text.strip()
+
+    if kind == 'pair' or kind == 'list':
+        remainder = [item.strip() for part in brackets.findall(text) for item in part.split(';') if item.strip() != '']
+        body = [item.strip() for item in brackets.sub('',text).split(';') if item.strip() != '']
+        if len(remainder) > 0:
+            flags |= flag_remainder
+        if len(body) + len(remainder) == 0:
+            flags |= flag_empty
+
+        if kind == 'list':
+            return {'values':float(len(body)),'flags':flags,'items':tuple(body),'remainder':tuple(remainder)}
+
+        values = [float(item) if number.match(item) else None for item in body[:1] + remainder[:1]]
+        if None in values:
+            flags |= flag_invalid
+        value = values[0] if len(body) > 0 and not values[0] is None else np.nan
+        rest = values[-1] if len(remainder) > 0 and not values[-1] is None else np.nan
+        return {'values':value if not value is None else np.nan,'flags':flags,'remainder':rest}
+
+    if text == '':
+        return {'values':np.nan,'flags':flags | flag_empty}
+    if text.lower() == 'n/a':
+        return {'values':np.nan,'flags':flags | flag_na}
+    if text[0] == '<':
+        flags |= flag_bound
+        text = text[1:].strip()
+
+    unit = {'time':'s','multiplier':'x','percent':'%'}.get(kind,'')
+    if len(unit) > 0 and text[-1:] == unit:
+        text = text[:-1]
+
+    if number.match(text):
+        return {'values':float(text),'flags':flags}
+    return {'values':np.nan,'flags':flags | flag_invalid}
+
+def read_roofs(fn):
+    """
+    Read the roofs from a roofs file or from the roofs section of an Advisor export. A line describes a
+    ceiling if it contains 'compute' or 'memory' and starts with a name ending with 'Peak' or 'Bandwidth';
+    the value is the last number of the line followed by a unit, converted to GB/s or GFLOPS, or else the
+    last number of the line in B/s or FLOP/s. Quotes and commas are ignored, so csv sections are read too.
+
+    Return a dictionary {'single':{name:value},'multi':{name:value}} with the formatted names of the
+    single-threaded and multi-threaded ceilings.
+    """
+
+    scales = {'b/s':1e-9,'flop/s':1e-9,'kb/s':1e-6,'kflop/s':1e-6,'mb/s':1e-3,'mflop/s':1e-3,
+              'gb/s':1.0,'gflop/s':1.0,'gflops':1.0,'tb/s':1e3,'tflop/s':1e3}
+
+    ceilings = {'single':dict(),'multi':dict()}
+
+    with open(fn,mode='r') as fh:
+        for line in fh:
+            text = line.replace('"',' ').replace(',',' ')
+            lower = text.lower()
+            if not ('compute' in lower or 'memory' in lower):
+                continue
+
+            i = max(text.find('Peak'),text.find('idth')) + 4
+            if i < 4:
+                continue
+            name = text[:i].replace('(single-threaded)','').replace('single-threaded','').strip()
+            if not roof_name.match(name):
+                continue
+            formatted_key = ''.join(name.split()).lower()
+
+            # Number followed by a known unit, or else the last number of the line
+            tokens = text[i:].split()
+            value = None
+            for k in range(len(tokens)-1,-1,-1):
+                try:
+                    token_value = float(tokens[k])
+                except ValueError:
+                    continue
+                unit = tokens[k+1].lower() if k+1 < len(tokens) else ''
+                if unit in scales:
+                    value = token_value * scales[unit]
+                    break
+                if value is None:
+                    value = token_value * 1e-9
+            if value is None:
+                continue
+
+            threads = 'single' if 'single-threaded' in lower else 'multi'
+            ceilings[threads][formatted_key] = value
+
+    if len(ceilings['single']) == 0 and len(ceilings['multi']) == 0:
+        raise ValueError('No roofs found in '+fn)
+
+    return ceilings
+
+def parse_location(fcsal):
+    """
+    Parse a function call sites and loops cell. Return (child,subroutine,file,line,name,kind,region,malformed):
+    child is True for the children, name is the function without the source location, kind is 'loop' for
+    '[loop in ...]' cells and 'function' for function rows, region is the OpenMP region of outlined functions
+    (e.g. 'parallel_for@55' for 'push_$omp$parallel_for@55'), and malformed is True if the cell doesn't have
+    the expected format. Cells without a source location have subroutine 'None', file 'None' and line 0.
+    """
+
+    label = fcsal
+    while label.startswith('[child]-'):
+        label = label[8:]
+    child = len(label) < len(fcsal)
+
+    if label.startswith('['):
+        if not label.endswith(']'):
+            return child,'None','None',0,label,'',None,True
+        kind,sep,name = label[1:-1].partition(' in ')
+        if len(sep) == 0 or '[' in kind or ']' in kind:
+            kind,name = 'function',label[1:-1]
+    else:
+        kind,name = 'function',label
+
+    region = omp_region.search(name) if '$omp$' in name else None
+    region = None if region is None else region.group(1)
+
+    subroutine,sep,source = name.rpartition(' at ')
+    if len(sep) == 0:
+        return child,'None','None',0,name,kind,region,False
+
+    file,sep,line = source.rpartition(':')
+    if len(sep) == 0 or not line.isdigit():
+        # ' at ' without a file:line is not a source location
+        return child,'None','None',0,name,kind,region,True
+
+    return child,subroutine,file,int(line),subroutine,kind,region,False
+
+def parse_locations(labels):
+    """
+    Parse a whole function call sites and loops column (see parse_location). Each distinct cell is parsed
+    once and the results are spread to the rows with numpy indexing.
+
+    Output:
+    -------
+    dictionary of arrays with one element per row: 'child' (bool), 'subroutine', 'file', 'line' (int),
+    'name', 'kind', 'region' (None if not an OpenMP region) and 'malformed' (bool)
+    -------
+    """
+
+    codes,locations = unique_locations(labels)
+    return dict((name,column[codes]) for name,column in locations.items())
+
+def unique_locations(labels):
+    """
+    Parse the distinct cells of a function call sites and loops column. Return the codes of the rows and
+    the dictionary of parse_locations with one element per distinct cell, so that the values of the rows
+    are column[codes].
+    """
+
+    vocab = dict()
+    codes = np.array([vocab.setdefault(label,len(vocab)) for label in list(labels)],dtype=np.int64)
+    parsed = [parse_location(label) for label in vocab]
+
+    names = ['child','subroutine','file','line','name','kind','region','malformed']
+    locations = dict()
+    for name,cells in zip(names,zip(*parsed) if len(parsed) > 0 else [()] * len(names)):
+        # Cells are kept as python objects like the cells of the other columns
+        column = np.empty(len(parsed),dtype=bool if name == 'malformed' else object)
+        column[:] = cells
+        locations[name] = column
+
+    return codes,locations
+
+def mpi_rank(preamble):
+    """
+    Return the MPI rank in the preamble of a report (line 'MPI rank:0'), or None
+    """
+    for row in preamble:
+        for cell in row:
+            match = rank_line.search(cell)
+            if match:
+                return int(match.group(1))
+    return None
+
+def import_pyplot():
+    """
+    Return the matplotlib.pyplot module. It is imported on the first plot, so that scripts that only
+    parse reports and run queries don't pay for the import of matplotlib and the choice of its backend.
+    """
+    import matplotlib.pyplot
+    return matplotlib.pyplot
+
+def import_pyarrow():
+    """
+    Return the pyarrow module, which is only needed for the Arrow and Parquet files
     """
-    felem = None
     try:
-        felem = float(elem)
-    except ValueError:
-        #felem = 0
-        if len(elem) > 0 and elem[-1] in 'sx':
-            try:                
-                felem = float(elem[:-1])
-            except ValueError:
-                pass
-    return felem
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError('pyarrow is needed to read and write Arrow and Parquet files, install it with pip install pyarrow')
+    return pyarrow
+
+def load_encoded(task):
+    """
+    Read the advisor report task = (fn,cache) and return it encoded, used by the worker processes of load_many
+    """
+    fn,cache = task
+    return advisor_results(fn,cache=cache).encode()
+
+def combine_stores(stores,names):
+    """
+    Concatenate the rows of several column stores into a single store with the union of their keys.
+    Cells of keys missing in a store are empty strings that can't be converted. A 'report' column
+    holds the name of the store each row comes from.
+
+    Input:
+    -------
+    stores: list of column_store objects
+    names : list of names of the stores, e.g. the report files
+    -------
+    """
+
+    keys = list()
+    for store in stores:
+        for key in store.keys:
+            if not key in keys:
+                keys.append(key)
+    keys.append('report')
+
+    combined = column_store(keys)
+    combined.nrows = sum(store.nrows for store in stores)
+
+    for key in keys[:-1]:
+        raw = list()
+        values = list()
+        valid = list()
+        for store in stores:
+            if key in store.keys:
+                raw.append(store.get_raw(key))
+                v,ok = store.get_float(key)
+                values.append(v)
+                valid.append(ok)
+            else:
+                missing = np.empty(store.nrows,dtype=object)
+                missing[:] = ''
+                raw.append(missing)
+                values.append(np.full(store.nrows,np.nan))
+                valid.append(np.zeros(store.nrows,dtype=bool))
+        combined.raw.append(np.concatenate(raw))
+        combined.valid.append(np.concatenate(valid))
+        combined.values.append(np.concatenate(values) if combined.valid[-1].any() else None)
+
+    report = np.empty(combined.nrows,dtype=object)
+    report[:] = [name for store,name in zip(stores,names) for i in range(store.nrows)]
+    combined.raw.append(report)
+    combined.values.append(None)
+    combined.valid.append(np.zeros(combined.nrows,dtype=bool))
+
+    combined._pending = None
+    combined._chunks = None
+    combined._vocab = None
+    combined._converted = None
+
+    return combined
+
+def save_array(fn,array):
+    """
+    Write array to the .npy file fn through a temporary file, so that fn is replaced at once
+    """
+    tmp = '{0}.{1}.tmp'.format(fn,os.getpid())
+    with open(tmp,mode='wb') as fh:
+        np.save(fh,array)
+    os.replace(tmp,fn)
+
+def save_json(fn,obj):
+    """
+    Write obj to the json file fn through a temporary file, so that fn is replaced at once
+    """
+    tmp = '{0}.{1}.tmp'.format(fn,os.getpid())
+    with open(tmp,mode='w') as fh:
+        json.dump(obj,fh)
+    os.replace(tmp,fn)
+
+def file_hash(fn):
+    """
+    Return the sha1 hash of the content of the file fn
+    """
+    sha = hashlib.sha1()
+    with open(fn,mode='rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20),b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def child_depth(fcsal):
+    """
+    Return the nesting level of a loop from its functioncallsitesandloops string, which starts with
+    one [child]- per level: 0 for loops that are not children, 1 for children, 2 for their children...
+    """
+    depth = 0
+    while fcsal.startswith('[child]-',8*depth):
+        depth += 1
+    if depth == 0 and fcsal.find('child') > 0:
+        depth = 1
+    return depth
+
+def csv_line(cells):
+    """
+    Return the cells as a line of a csv file, without the line terminator
+    """
+    fh = io.StringIO()
+    csv.writer(fh,lineterminator='').writerow(cells)
+    return fh.getvalue()
+
+def sort_keys(keys,descending):
+    """
+    Return the sort keys and the descending flags of argsort as two tuples of the same length
+    """
+    if not type(keys) in [list,tuple]:
+        keys = [keys]
+    if not type(descending) in [list,tuple]:
+        descending = [descending] * len(keys)
+    return tuple(keys),tuple(bool(d) for d in descending)
+
+def format_key(key):
+    """
+    Format a key of the csv file into the name of the loop attribute: blanks and the characters
+    that cannot be used in attribute names are removed and the key is lower cased.
+    """
+    bad_chars = ['%',',','/','(',')','[',']']
+
+    formatted_key = ''.join(key.split()).lower()
+    for char in bad_chars:
+        formatted_key = formatted_key.replace(char,'')
+    return formatted_key
 
 def convert_to_int(elem):
     """
@@ -0,0 +1,196 @@
+"""
+ ___________________________________________________________________
+
+ ADVISOR_BATCH.PY
+
+ Headless rendering of the roofline plots of many Advisor reports,
+ e.g. for every nightly run, in a pool of worker processes.
+
+   python advisor_batch.py --output figures --roofs roofs.dat run1.csv run2.csv
+ ___________________________________________________________________
+"""
+
+import argparse
+import html
+import multiprocessing
+import os
+import time
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import advisor
+
+# Keys of a plot spec that are not arguments of advisor_results.plot
+spec_keys = ['report','name','title','roofs','single','figsize']
+
+# Reports already parsed by the current process, by file name
+reports = dict()
+
+def render_reports(specs,outdir,workers=None,fmt='png',dpi=100,cache=True,index='index.html'):
+    """
+    Render one roofline figure per plot spec in a pool of worker processes with the Agg backend,
+    and write the images and an index page to outdir. No display is needed.
+
+    A plot spec is a dictionary with the report file in 'report' and optionally the base name of the
+    image in 'name', a title in 'title', a roofs file in 'roofs' (with 'single' for the single-threaded
+    ceilings), the figure size in inches in 'figsize' and any arguments of advisor_results.plot,
+    e.g. {'report':'run1.csv','sizeKey':'selftime','colorKey':'gainestimate','where':condition(...)}.
+    Each worker parses a report once for all the specs using it.
+
+    Input:
+    -------
+    specs   : list of plot specs
+    outdir  : directory of the images and the index page, created if needed
+    workers : number of worker processes (default: number of cores)
+    fmt     : image format understood by matplotlib, e.g. 'png' or 'svg' (default 'png')
+    dpi     : resolution of the images (default 100)
+    cache   : if True, the workers read and write the binary caches of the reports
+    index   : name of the index page in outdir, None for no index page (default 'index.html')
+    -------
+
+    Output:
+    -------
+    list of dictionaries, one per spec in the order of specs, with the keys 'name', 'report', 'title',
+    'image' (file name in outdir, None on error), 'loops' (number of plotted loops), 'seconds' and 'error'
+    -------
+    """
+
+    os.makedirs(outdir,exist_ok=True)
+
+    tasks = list()
+    for i,spec in enumerate(specs):
+        spec = dict(spec)
+        if spec.get('name') is None:
+            spec['name'] = '{0:04d}_{1}'.format(i,os.path.splitext(os.path.basename(spec['report']))[0])
+        tasks.append((i,spec,outdir,fmt,dpi,cache))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1,min(workers,len(tasks)))
+
+    # Specs of the same report go to the same worker as far as possible
+    tasks.sort(key=lambda task: (task[1]['report'],task[0]))
+
+    if workers == 1:
+        # The figures are drawn on Agg canvases, the backend of the calling process is left as it is
+        results = [render_task(task) for task in tasks]
+    else:
+        chunksize = max(1,len(tasks) // (4 * workers))
+        with multiprocessing.Pool(workers,initializer=init_worker) as pool:
+            results = pool.map(render_task,tasks,chunksize=chunksize)
+
+    results = [result for i,result in sorted(results,key=lambda res: res[0])]
+
+    if not index is None:
+        write_index(os.path.join(outdir,index),results)
+
+    return results
+
+def init_worker():
+    """
+    Select the Agg backend in a worker process of the pool
+    """
+    matplotlib.use('Agg')
+
+def render_task(task):
+    """
+    Render the figure of one plot spec, see render_reports. Return (position of the spec, result).
+    """
+
+    i,spec,outdir,fmt,dpi,cache = task
+    result = {'name':spec['name'],
+              'report':spec['report'],
+              'title':spec.get('title',spec['name']),
+              'image':None,
+              'loops':0,
+              'seconds':0.0,
+              'error':None}
+
+    start = time.perf_counter()
+    try:
+        adv = reports.get(spec['report'])
+        if adv is None:
+            adv = advisor.advisor_results(spec['report'],cache=cache)
+            reports[spec['report']] = adv
+
+        # The figure is not registered with pyplot, so nothing is shown and nothing is kept
+        fig = Figure(figsize=spec.get('figsize',(8,6)))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1,1,1)
+
+        args = dict((key,val) for key,val in spec.items() if not key in spec_keys)
+        args['tooltips'] = False
+        adv.plot(ax=ax,**args)
+        result['loops'] = len(adv.get_rows(**dict((key,val) for key,val in args.items()
+                                                  if key in ['filterVal','filterKey','filterOp','where'])))
+
+        if not spec.get('roofs') is None:
+            advisor.load_roofs(spec['roofs'],single=spec.get('single',False)).plot(ax)
+
+        ax.set_title(result['title'])
+
+        image = '{0}.{1}'.format(spec['name'],fmt)
+        fig.savefig(os.path.join(outdir,image),format=fmt,dpi=dpi)
+        result['image'] = image
+    except Exception as err:
+        # One broken report doesn't stop the batch, the error is shown in the index page
+        result['error'] = '{0}: {1}'.format(type(err).__name__,err)
+    result['seconds'] = time.perf_counter() - start
+
+    return i,result
+
+def write_index(fn,results):
+    """
+    Write an html page showing the images of render_reports
+    """
+
+    with open(fn,mode='w') as fh:
+        fh.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>pyAdvisor rooflines</title></head>\n<body>\n')
+        fh.write('<h1>pyAdvisor rooflines</h1>\n')
+        fh.write('<p>{0} figures, generated {1}</p>\n'.format(len(results),time.strftime('%Y-%m-%d %H:%M:%S')))
+        fh.write('<table>\n<tr><th>Figure</th><th>Report</th><th>Loops</th><th>Image</th></tr>\n')
+        for result in results:
+            if result['error'] is None:
+                image = '<a href="{0}"><img src="{0}" width="400"></a>'.format(html.escape(result['image']))
+            else:
+                image = '<pre>{0}</pre>'.format(html.escape(result['error']))
+            fh.write('<tr><td>{0}</td><td>{1}</td><td>{2}</td><td>{3}</td></tr>\n'.format(
+                html.escape(result['title']),html.escape(result['report']),result['loops'],image))
+        fh.write('</table>\n</body>\n</html>\n')
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Render the roofline plots of Advisor reports without a display')
+    parser.add_argument('reports',nargs='+',help='advisor report files')
+    parser.add_argument('--output',default='figures',help='directory of the images and index page')
+    parser.add_argument('--roofs',default=None,help='roofs file drawn in every figure')
+    parser.add_argument('--single',action='store_true',help='draw the single-threaded roofs')
+    parser.add_argument('--sizeKey',default='selftime',help='key of the marker sizes')
+    parser.add_argument('--colorKey',default='gainestimate',help='key of the marker colors')
+    parser.add_argument('--markersize',type=float,default=200,help='scaling factor of the marker sizes')
+    parser.add_argument('--format',default='png',help='image format, e.g. png or svg')
+    parser.add_argument('--dpi',type=int,default=100,help='resolution of the images')
+    parser.add_argument('--workers',type=int,default=None,help='number of worker processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    specs = [{'report':fn,
+              'title':os.path.basename(fn),
+              'roofs':args.roofs,
+              'single':args.single,
+              'sizeKey':args.sizeKey,
+              'colorKey':args.colorKey,
+              'markersize':args.markersize} for fn in args.reports]
+
+    start = time.perf_counter()
+    results = render_reports(specs,args.output,workers=args.workers,fmt=args.format,dpi=args.dpi)
+
+    failed = [result for result in results if not result['error'] is None]
+    print(' {0} figures written to {1} in {2:.2f} s'.format(len(results) - len(failed),args.output,
+                                                          time.perf_counter() - start))
+    for result in failed:
+        print(' {0}: {1}'.format(result['report'],result['error']))
+
+if __name__ == '__main__':
+    main()
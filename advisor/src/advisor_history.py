@@ -0,0 +1,189 @@
+"""
+ ___________________________________________________________________
+
+ ADVISOR_HISTORY.PY
+
+ Database of the results of many Advisor runs, to follow the
+ performance of loops across code versions and builds.
+ ___________________________________________________________________
+"""
+
+import sqlite3
+import time
+import numpy as np
+
+class history():
+    """
+    This class stores parsed advisor reports in a SQLite database. Each report is ingested as a run
+    with a tag (e.g. nightly-2017-03-01) and optional git sha, date and node type. Loops are identified
+    across runs by advisor_results.loop_ids, and the values of the keys in the keys - field are stored
+    for every loop of every run. Lookups of a loop across runs go through the primary key of the
+    measurements table, so their cost doesn't grow with the number of runs in the database.
+    """
+
+    keys = ['selftime','totaltime','ai','gflops','gflop','gainestimate']
+
+    def __init__(self,fn):
+        """
+        This constructor opens the database, creating the tables if needed.
+
+        Input:
+        -------------
+        fn: database file, ':memory:' for a temporary database
+        -------------
+        """
+
+        self.filename = fn
+        self.connection = sqlite3.connect(fn)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        values = ','.join('{0} REAL'.format(key) for key in self.keys)
+
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY,
+                    tag TEXT UNIQUE NOT NULL,
+                    sha TEXT,
+                    date TEXT,
+                    node TEXT,
+                    report TEXT,
+                    ingested REAL);
+                CREATE INDEX IF NOT EXISTS runs_date ON runs(date);
+                CREATE TABLE IF NOT EXISTS loops (
+                    loop_id INTEGER PRIMARY KEY,
+                    subroutine TEXT,
+                    file TEXT,
+                    line INTEGER,
+                    occurrence INTEGER,
+                    kind TEXT,
+                    child_occurrence INTEGER,
+                    UNIQUE(subroutine,file,line,occurrence,kind,child_occurrence));
+                CREATE INDEX IF NOT EXISTS loops_location ON loops(file,line);
+                CREATE TABLE IF NOT EXISTS measurements (
+                    loop_id INTEGER,
+                    run_id INTEGER,
+                    {0},
+                    PRIMARY KEY(loop_id,run_id)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS measurements_run ON measurements(run_id);
+                '''.format(values))
+
+    def close(self):
+        """
+        Close the database
+        """
+        self.connection.close()
+
+    def ingest(self,adv,tag,sha=None,date=None,node=None):
+        """
+        Store all the loops of a report under a new run. The loops are inserted in bulk through a
+        temporary table and matched to the known loops with the unique index of the loops table.
+
+        Inputs:
+        -------
+        adv  : advisor_results - parsed report
+        tag  : string - unique name of the run
+        sha  : string - git sha of the code (default None)
+        date : string - date of the run, ISO format so that runs sort by date (default None)
+        node : string - node type (default None)
+        -------
+
+        Output:
+        -------
+        run_id of the new run
+        -------
+        """
+
+        ids = adv.loop_ids()
+
+        # Values of each key, None where the cell can't be converted
+        columns = list()
+        for key in self.keys:
+            if adv.store.has_key(key):
+                values,valid = adv.store.get_float(key)
+                columns.append([float(v) if ok else None for v,ok in zip(values,valid)])
+            else:
+                columns.append([None] * len(ids))
+
+        staged = [lid + tuple(vals) for lid,vals in zip(ids,zip(*columns))]
+
+        names = ','.join(self.keys)
+        placeholders = ','.join('?' * (6 + len(self.keys)))
+
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (tag,sha,date,node,report,ingested) VALUES (?,?,?,?,?,?)',
+                (tag,sha,date,node,adv.filename,time.time()))
+            run_id = cursor.lastrowid
+
+            self.connection.execute('DROP TABLE IF EXISTS temp.staged')
+            self.connection.execute(
+                'CREATE TEMP TABLE staged (subroutine,file,line,occurrence,kind,child_occurrence,{0})'.format(names))
+            self.connection.executemany(
+                'INSERT INTO staged VALUES ({0})'.format(placeholders),staged)
+
+            self.connection.execute(
+                '''INSERT OR IGNORE INTO loops (subroutine,file,line,occurrence,kind,child_occurrence)
+                   SELECT subroutine,file,line,occurrence,kind,child_occurrence FROM staged''')
+            self.connection.execute(
+                '''INSERT INTO measurements (loop_id,run_id,{0})
+                   SELECT loops.loop_id,?,{1} FROM staged JOIN loops
+                   USING (subroutine,file,line,occurrence,kind,child_occurrence)'''.format(
+                       names,','.join('staged.'+key for key in self.keys)),
+                (run_id,))
+            self.connection.execute('DROP TABLE temp.staged')
+
+        return run_id
+
+    def runs(self):
+        """
+        Return the list of runs as tuples (run_id,tag,sha,date,node,report), sorted by date
+        """
+        cursor = self.connection.execute('SELECT run_id,tag,sha,date,node,report FROM runs ORDER BY date,run_id')
+        return cursor.fetchall()
+
+    def get_series(self,key,file,line,subroutine=None,occurrence=0,kind='',child_occurrence=0,last=None):
+        """
+        Return the values of key for a loop over the runs, e.g. the self time of particles_push.F90:1295
+        over the last 50 runs. The loop is the one identified by file and line, and by subroutine if given;
+        children are selected with kind and child_occurrence (see advisor_results.loop_ids).
+
+        Inputs:
+        -------
+        key        : string - one of the keys in history.keys
+        file       : string - source file of the loop
+        line       : integer - line of the loop
+        subroutine : string - subroutine of the loop (default None, any subroutine)
+        last       : integer - number of most recent runs to return (default None, all runs)
+        -------
+
+        Output:
+        -------
+        tags, dates and values as numpy arrays, sorted by date. Values that were not converted are NaN.
+        -------
+        """
+
+        if not key in self.keys:
+            raise KeyError(key)
+
+        query = '''SELECT runs.tag,runs.date,measurements.{0}
+                   FROM loops JOIN measurements USING (loop_id) JOIN runs USING (run_id)
+                   WHERE loops.file=? AND loops.line=? AND loops.occurrence=?
+                   AND loops.kind=? AND loops.child_occurrence=?'''.format(key)
+        args = [file,line,occurrence,kind,child_occurrence]
+        if not subroutine is None:
+            query += ' AND loops.subroutine=?'
+            args.append(subroutine)
+        query += ' ORDER BY runs.date DESC,runs.run_id DESC'
+        if not last is None:
+            query += ' LIMIT ?'
+            args.append(last)
+
+        rows = self.connection.execute(query,args).fetchall()[::-1]
+
+        tags = np.array([row[0] for row in rows],dtype=object)
+        dates = np.array([row[1] for row in rows],dtype=object)
+        values = np.array([np.nan if row[2] is None else row[2] for row in rows],dtype=np.float64)
+
+        return tags,dates,values
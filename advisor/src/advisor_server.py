@@ -0,0 +1,645 @@
+"""
+ ___________________________________________________________________
+
+ ADVISOR_SERVER.PY
+
+ Local read-only query server that keeps parsed Advisor reports in
+ memory, so that several analysts can query the same large reports
+ without parsing them again in every Python session.
+
+   python advisor_server.py --port 8765 --max-reports 8 run1.csv run2.csv
+
+ Queries are HTTP POST requests with a JSON body, e.g.
+
+   curl -d '{"report":"run1.csv","key":"ai","where":{"file":"push.F90"}}' localhost:8765/query/get_array
+
+ and advisor_client mirrors the methods of advisor_results on top of them.
+ ___________________________________________________________________
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import json
+import os
+import socket
+import threading
+
+import numpy as np
+
+import advisor
+
+default_port = 8765
+
+# Rows per chunk of the streamed responses
+batch_rows = 1000
+
+class report_cache():
+    """
+    This is a class for the reports kept in memory by the server. Reports are parsed on first use in a
+    worker thread and evicted in least recently used order beyond max_reports. A report is parsed again
+    if its file changes, and requests for a report that is being parsed wait for the same parse.
+    """
+
+    def __init__(self,max_reports=8,cache=True,root=None):
+        """
+        Input:
+        -------------
+        max_reports : number of reports kept in memory
+        cache       : if True, the binary caches of the reports are read and written (see advisor_results)
+        root        : if given, only the reports in this directory can be opened, and relative paths are
+                      relative to it
+        -------------
+        """
+
+        self.max_reports = max_reports
+        self.cache = cache
+        self.root = None if root is None else os.path.realpath(root)
+
+        # path -> (size and modification time of the file, advisor_results)
+        self.reports = collections.OrderedDict()
+        # path -> future of the parse in progress
+        self.loading = dict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self,fn):
+        """
+        Return the real path of the report fn, raise PermissionError if it is outside root
+        """
+
+        if self.root is None:
+            return os.path.realpath(fn)
+
+        path = os.path.realpath(os.path.join(self.root,fn))
+        if os.path.commonpath([self.root,path]) != self.root:
+            raise PermissionError('{0} is outside of {1}'.format(fn,self.root))
+        return path
+
+    async def get(self,fn,executor):
+        """
+        Return the path and the signature of the report fn and the parsed report
+        """
+
+        path = self.resolve(fn)
+        stat = os.stat(path)
+        signature = (stat.st_size,stat.st_mtime)
+
+        entry = self.reports.get(path)
+        if not entry is None and entry[0] == signature:
+            self.reports.move_to_end(path)
+            self.hits += 1
+            return path,signature,entry[1]
+
+        future = self.loading.get(path)
+        if future is None:
+            self.misses += 1
+            future = asyncio.get_running_loop().run_in_executor(executor,advisor.advisor_results,path,self.cache)
+            self.loading[path] = future
+            try:
+                adv = await future
+            finally:
+                del self.loading[path]
+
+            self.reports[path] = (signature,adv)
+            self.reports.move_to_end(path)
+            while len(self.reports) > self.max_reports:
+                self.reports.popitem(last=False)
+        else:
+            adv = await future
+
+        return path,signature,adv
+
+    def status(self):
+        """
+        Return the reports in memory, least recently used first, and the hit and miss counts
+        """
+        return {'reports':[{'report':path,'loops':adv.store.nrows} for path,(signature,adv) in self.reports.items()],
+                'loading':list(self.loading),
+                'hits':self.hits,
+                'misses':self.misses}
+
+# ___________________________________________________________________
+#
+# Queries
+# ___________________________________________________________________
+
+def query_keys(adv,args):
+    return {'keys':adv.get_keys()}
+
+def query_get_array(adv,args):
+    values = adv.get_array(args['key'],include_children=args.get('include_children',True),
+                           where=condition_from_json(args.get('where')))
+    return {'values':values,'dtype':values.dtype.str}
+
+def query_get_sum(adv,args):
+    return {'sum':adv.get_sum(args['key'])}
+
+def query_group_by(adv,args):
+    return adv.group_by(by=args.get('by'),keys=args.get('keys',['selftime','totaltime','gflop']),
+                        where=condition_from_json(args.get('where')))
+
+def query_top(adv,args):
+    result = adv.top(n=args.get('n',20),key=args.get('key','selftime'),by=args.get('by'),share=args.get('share'),
+                     where=condition_from_json(args.get('where')))
+    if 'rows' in result:
+        result['loops'] = adv.get_values('functioncallsitesandloops',result['rows'])
+    return result
+
+def query_roofline(adv,args):
+    """
+    Data of the roofline plot: the coordinates, sizes and colors of the loops drawn by advisor_results.plot,
+    and with a roofs file the ceilings and the binding roof of each loop (see classify_roofs)
+    """
+
+    where = condition_from_json(args.get('where'))
+    rows = adv.get_rows(where=where)
+    result = {'rows':rows,
+              'loops':adv.get_values('functioncallsitesandloops',rows),
+              'ai':adv.get_floats('ai',rows),
+              'gflops':adv.get_floats('gflops',rows)}
+
+    for name,default,fill in [('sizeKey','selftime',0.0),('colorKey','gainestimate',np.nan)]:
+        key = args.get(name,default)
+        if not key is None:
+            result[name[:-3]] = adv.get_floats(key,rows,fill)
+
+    if not args.get('roofs') is None:
+        r = advisor.load_roofs(args['roofs'],single=args.get('single',False))
+        classified = adv.classify_roofs(r.model(),where=where)
+        result['ceilings'] = r.ceilings['single' if r.single else 'multi']
+        for name in ['roof','ceiling','percent','attainable']:
+            result[name] = classified[name]
+
+    return result
+
+def query_loops(adv,args):
+    """
+    Listing of the loops used by get_array, streamed as a header with the keys and the number of loops
+    followed by one row of values per loop
+    """
+
+    keys = args.get('keys',['functioncallsitesandloops','selftime','ai','gflops'])
+    rows = adv.get_rows(include_children=args.get('include_children',True),where=condition_from_json(args.get('where')),
+                        sort_by=args.get('sort_by'),descending=args.get('descending',False))
+    if not args.get('limit') is None:
+        rows = rows[:args['limit']]
+
+    # Unknown keys are reported before the response starts
+    for key in keys:
+        if not adv.store.has_key(key):
+            raise KeyError(key)
+
+    yield {'keys':keys,'count':len(rows)}
+    for start in range(0,len(rows),batch_rows):
+        chunk = rows[start:start+batch_rows]
+        columns = [to_json(adv.get_values(key,chunk)) for key in keys]
+        yield [list(row) for row in zip(chunk.tolist(),*columns)]
+
+# name -> function(advisor_results,arguments), the streamed queries are generators
+queries = {'keys':query_keys,
+           'get_array':query_get_array,
+           'get_sum':query_get_sum,
+           'group_by':query_group_by,
+           'top':query_top,
+           'roofline':query_roofline,
+           'loops':query_loops}
+
+streamed = ['loops']
+
+def condition_to_json(cond):
+    """
+    Return the JSON form of a condition (see condition_from_json). Dictionaries of terms are kept as they are.
+    """
+
+    if cond is None or isinstance(cond,dict):
+        return cond
+    if cond.combine is None:
+        return {'terms':[[key,op,val] for key,op,val in cond.terms]}
+    return {cond.combine:[condition_to_json(c) for c in cond.conditions]}
+
+def condition_from_json(obj):
+    """
+    Build a condition from its JSON form: a dictionary of terms key__op:value as in the constructor of
+    condition, {'terms':[[key,op,value],...]}, or {'and':[c1,c2]}, {'or':[c1,c2]}, {'not':[c]}
+    """
+
+    if obj is None:
+        return None
+
+    for combine in ['and','or','not']:
+        if combine in obj:
+            cond = advisor.condition._combined(combine,[condition_from_json(c) for c in obj[combine]])
+            if len(cond.conditions) != (1 if combine == 'not' else 2):
+                raise ValueError('Wrong number of conditions in {0}'.format(combine))
+            return cond
+
+    if 'terms' in obj:
+        cond = advisor.condition()
+        for key,op,val in obj['terms']:
+            if not op in advisor.condition.operators:
+                raise ValueError('Unknown filter operator {0} in {1}'.format(op,key))
+            cond.terms.append((key,op,val))
+        return cond
+
+    return advisor.condition(**obj)
+
+def to_json(obj):
+    """
+    Convert numpy arrays and scalars to lists and numbers that json can write, NaN and infinities become None
+    """
+
+    if isinstance(obj,dict):
+        return dict((str(key),to_json(val)) for key,val in obj.items())
+    if isinstance(obj,(list,tuple)):
+        return [to_json(val) for val in obj]
+    if isinstance(obj,np.ndarray):
+        if obj.dtype.kind == 'f':
+            out = obj.astype(object)
+            out[~np.isfinite(obj)] = None
+            return out.tolist()
+        if obj.dtype == object:
+            return [to_json(val) for val in obj.tolist()]
+        return obj.tolist()
+    if isinstance(obj,np.generic):
+        return to_json(obj.item())
+    if isinstance(obj,float) and not np.isfinite(obj):
+        return None
+    return obj
+
+def encode(obj):
+    return json.dumps(to_json(obj),separators=(',',':')).encode()
+
+# ___________________________________________________________________
+#
+# Server
+# ___________________________________________________________________
+
+class query_server():
+    """
+    This is a class for the asyncio HTTP/JSON server. Routes:
+
+      POST /query/<name>   run the query name (see queries) on the report given in the 'report' field
+                           of the JSON body, the other fields are the arguments of the query
+      GET  /status         reports in memory and cache statistics
+
+    Queries run in a pool of worker threads so that the server keeps answering while a report is parsed.
+    The responses of the queries that are not streamed are kept in a LRU cache by report version and
+    request, so repeated queries are answered without touching the report.
+    """
+
+    def __init__(self,max_reports=8,max_responses=256,workers=None,cache=True,root=None):
+        """
+        Input:
+        -------------
+        max_reports   : number of reports kept in memory (see report_cache)
+        max_responses : number of responses kept in memory
+        workers       : number of worker threads (default: as concurrent.futures.ThreadPoolExecutor)
+        cache         : if True, the binary caches of the reports are read and written
+        root          : if given, only the reports and roofs files in this directory can be opened
+        -------------
+        """
+
+        self.reports = report_cache(max_reports=max_reports,cache=cache,root=root)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.max_responses = max_responses
+        self.responses = collections.OrderedDict()
+        self.requests = 0
+        self.servers = list()
+        # Tasks answering the open connections
+        self.connections = dict()
+
+    async def start(self,host='127.0.0.1',port=default_port,socket_path=None):
+        """
+        Start listening on host:port, or on the Unix socket socket_path if given. Return the bound address.
+        """
+
+        if socket_path is None:
+            server = await asyncio.start_server(self.handle,host,port)
+        else:
+            server = await asyncio.start_unix_server(self.handle,socket_path)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()
+
+    async def preload(self,reports):
+        """
+        Parse reports before the first queries
+        """
+        for fn in reports:
+            await self.reports.get(fn,self.executor)
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        self.servers = list()
+        self.executor.shutdown(wait=False)
+
+    def run(self,host='127.0.0.1',port=default_port,socket_path=None,reports=[]):
+        """
+        Serve until interrupted
+        """
+
+        async def serve():
+            address = await self.start(host,port,socket_path)
+            print(' Serving on {0}'.format(address))
+            await self.preload(reports)
+            await asyncio.gather(*[server.serve_forever() for server in self.servers])
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def run_in_thread(self,host='127.0.0.1',port=0,socket_path=None):
+        """
+        Serve from a background thread, e.g. in a notebook. Port 0 picks a free port.
+        Return the bound address and a function stopping the server.
+        """
+
+        loop = asyncio.new_event_loop()
+        address = loop.run_until_complete(self.start(host,port,socket_path))
+        thread = threading.Thread(target=loop.run_forever,daemon=True)
+        thread.start()
+
+        async def shutdown():
+            # Open connections are closed along with the server
+            for server in self.servers:
+                server.close()
+            tasks = list(self.connections)
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*tasks,return_exceptions=True)
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(shutdown(),loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            self.close()
+            loop.close()
+
+        return address,stop
+
+    async def handle(self,reader,writer):
+        """
+        Answer the requests of a connection, which is kept alive until the client closes it
+        """
+
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+
+                method,target,version = line.decode('latin-1').split()
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in [b'\r\n',b'\n',b'']:
+                        break
+                    name,sep,val = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = val.strip()
+                body = await reader.readexactly(int(headers.get('content-length',0)))
+
+                self.requests += 1
+                await self.respond(writer,method,target,body)
+
+                if version == 'HTTP/1.0' or headers.get('connection','').lower() == 'close':
+                    break
+        except (ConnectionError,asyncio.IncompleteReadError,ValueError):
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    async def respond(self,writer,method,target,body):
+        """
+        Run the query of one request and write the response
+        """
+
+        try:
+            if method == 'GET' and target == '/status':
+                status = self.reports.status()
+                status['requests'] = self.requests
+                status['responses'] = len(self.responses)
+                return await self.send(writer,200,encode(status))
+
+            name = target[len('/query/'):] if target.startswith('/query/') else None
+            if method != 'POST' or not name in queries:
+                return await self.send(writer,404,encode({'error':'Unknown query {0} {1}'.format(method,target)}))
+
+            args = json.loads(body or b'{}')
+            path,signature,adv = await self.reports.get(args.pop('report'),self.executor)
+            if not args.get('roofs') is None:
+                args['roofs'] = self.reports.resolve(args['roofs'])
+            loop = asyncio.get_running_loop()
+
+            if name in streamed:
+                return await self.stream(writer,loop,queries[name](adv,args))
+
+            key = (path,signature,name,json.dumps(args,sort_keys=True))
+            response = self.responses.get(key)
+            if response is None:
+                response = await loop.run_in_executor(self.executor,lambda: encode(queries[name](adv,args)))
+                self.responses[key] = response
+                while len(self.responses) > self.max_responses:
+                    self.responses.popitem(last=False)
+            else:
+                self.responses.move_to_end(key)
+            await self.send(writer,200,response)
+
+        except ConnectionError:
+            raise
+        except FileNotFoundError as err:
+            await self.send(writer,404,encode({'error':str(err)}))
+        except PermissionError as err:
+            await self.send(writer,403,encode({'error':str(err)}))
+        except (KeyError,ValueError,TypeError,IndexError) as err:
+            await self.send(writer,400,encode({'error':'{0}: {1}'.format(type(err).__name__,err)}))
+        except Exception as err:
+            await self.send(writer,500,encode({'error':'{0}: {1}'.format(type(err).__name__,err)}))
+
+    async def send(self,writer,code,body):
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n\r\n'.format(
+            code,http.client.responses[code],len(body)).encode() + body)
+        await writer.drain()
+
+    async def stream(self,writer,loop,generator):
+        """
+        Write the items of a streamed query as JSON lines in chunks, one chunk per item. The items are
+        computed in the worker threads; the first one is computed before the headers are written, so
+        that errors in the arguments are still answered with an error code. Later errors can't be answered
+        anymore, the connection is closed without the last chunk and the client sees an incomplete response.
+        """
+
+        done = object()
+        item = await loop.run_in_executor(self.executor,next,generator,done)
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n')
+        try:
+            while not item is done:
+                lines = b''.join(encode(row) + b'\n' for row in (item if isinstance(item,list) else [item]))
+                writer.write('{0:x}\r\n'.format(len(lines)).encode() + lines + b'\r\n')
+                await writer.drain()
+                item = await loop.run_in_executor(self.executor,next,generator,done)
+        except ConnectionError:
+            raise
+        except Exception as err:
+            raise ConnectionAbortedError('Streamed query failed: {0}: {1}'.format(type(err).__name__,err)) from err
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+# ___________________________________________________________________
+#
+# Client
+# ___________________________________________________________________
+
+class unix_connection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket
+    """
+
+    def __init__(self,socket_path,timeout=None):
+        http.client.HTTPConnection.__init__(self,'localhost',timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        if not self.timeout is None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class advisor_client():
+    """
+    This is a thin client of query_server for one report. Its methods mirror the ones of advisor_results
+    and return numpy arrays. Conditions are sent as JSON, so where takes condition objects or dictionaries
+    of terms but the filterVal/filterKey/filterOp functions are not available.
+
+    Example: adv = advisor_client('run1.csv',port=8765)
+             ai = adv.get_array('ai',where=advisor.condition(file='current_deposition.F90'))
+    """
+
+    def __init__(self,report,host='127.0.0.1',port=default_port,socket_path=None,timeout=None):
+        """
+        Input:
+        -------------
+        report      : report file, as seen by the server
+        host, port  : address of the server
+        socket_path : Unix socket of the server, used instead of host and port if given
+        timeout     : timeout of the connection in seconds (default None)
+        -------------
+        """
+
+        self.filename = report
+        if socket_path is None:
+            self.connection = http.client.HTTPConnection(host,port,timeout=timeout)
+        else:
+            self.connection = unix_connection(socket_path,timeout=timeout)
+
+    def close(self):
+        self.connection.close()
+
+    def _request(self,method,target,args=None):
+        body = None if args is None else json.dumps(dict(args,report=self.filename)).encode()
+        self.connection.request(method,target,body=body,headers={'Content-Type':'application/json'})
+        response = self.connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError('{0} {1}: {2}'.format(response.status,response.reason,
+                                                     json.loads(response.read()).get('error')))
+        return response
+
+    def query(self,name,**args):
+        """
+        Run the query name on the server and return the decoded JSON response
+        """
+        return json.loads(self._request('POST','/query/'+name,args).read())
+
+    def status(self):
+        return json.loads(self._request('GET','/status').read())
+
+    def get_keys(self):
+        return self.query('keys')['keys']
+
+    def get_array(self,key,include_children=True,where=None):
+        result = self.query('get_array',key=key,include_children=include_children,where=condition_to_json(where))
+        return to_array(result['values'],result['dtype'])
+
+    def get_sum(self,key):
+        return self.query('get_sum',key=key)['sum']
+
+    def group_by(self,by=None,keys=['selftime','totaltime','gflop'],where=None):
+        result = self.query('group_by',by=by,keys=keys,where=condition_to_json(where))
+        return dict((name,to_array(values)) for name,values in result.items())
+
+    def top(self,n=20,key='selftime',by=None,share=None,where=None):
+        result = self.query('top',n=n,key=key,by=by,share=share,where=condition_to_json(where))
+        return dict((name,to_array(values)) for name,values in result.items())
+
+    def roofline(self,sizeKey='selftime',colorKey='gainestimate',roofs=None,single=False,where=None):
+        """
+        Return the data of the roofline plot, see query_roofline. The roofs file is opened by the server,
+        within its root directory if it has one.
+        """
+        result = self.query('roofline',sizeKey=sizeKey,colorKey=colorKey,roofs=roofs,single=single,
+                            where=condition_to_json(where))
+        return dict((name,values if name == 'ceilings' else to_array(values)) for name,values in result.items())
+
+    def loops(self,keys=['functioncallsitesandloops','selftime','ai','gflops'],include_children=True,where=None,
+              sort_by=None,descending=False,limit=None):
+        """
+        Iterate over the loops used by get_array as dictionaries key -> value, with the row of the loop
+        in 'row'. The loops are streamed, so large listings are not held in memory by the client.
+        """
+
+        response = self._request('POST','/query/loops',{'keys':keys,'include_children':include_children,
+                                                        'where':condition_to_json(where),'sort_by':sort_by,
+                                                        'descending':descending,'limit':limit})
+        header = json.loads(response.readline())
+        names = ['row'] + header['keys']
+        for line in response:
+            yield dict(zip(names,json.loads(line)))
+
+def to_array(values,dtype=None):
+    """
+    Convert a list decoded from JSON to a numpy array: None is NaN in number lists, other lists are object arrays
+    """
+
+    if not dtype is None and np.dtype(dtype).kind == 'f':
+        return np.array([np.nan if val is None else val for val in values],dtype=np.float64)
+
+    numbers = [val for val in values if not val is None]
+    if all(isinstance(val,(int,float)) and not isinstance(val,bool) for val in numbers):
+        if len(numbers) == len(values) and all(isinstance(val,int) for val in numbers) and len(values) > 0:
+            return np.array(values,dtype=np.int64)
+        if len(values) > 0:
+            return np.array([np.nan if val is None else val for val in values],dtype=np.float64)
+
+    array = np.empty(len(values),dtype=object)
+    array[:] = values
+    return array
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Local read-only query server for Advisor reports')
+    parser.add_argument('reports',nargs='*',help='advisor report files parsed at startup')
+    parser.add_argument('--host',default='127.0.0.1',help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port',type=int,default=default_port,help='port to listen on')
+    parser.add_argument('--socket',default=None,help='Unix socket to listen on instead of host and port')
+    parser.add_argument('--root',default=None,help='only serve the reports and roofs files in this directory')
+    parser.add_argument('--max-reports',type=int,default=8,help='number of reports kept in memory')
+    parser.add_argument('--max-responses',type=int,default=256,help='number of responses kept in memory')
+    parser.add_argument('--workers',type=int,default=None,help='number of worker threads')
+    parser.add_argument('--no-cache',action='store_true',help='do not read or write the binary caches of the reports')
+    args = parser.parse_args(argv)
+
+    server = query_server(max_reports=args.max_reports,max_responses=args.max_responses,workers=args.workers,
+                          cache=not args.no_cache,root=args.root)
+    server.run(host=args.host,port=args.port,socket_path=args.socket,reports=args.reports)
+
+if __name__ == '__main__':
+    main()
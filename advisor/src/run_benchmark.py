@@ -0,0 +1,248 @@
+#
+# Benchmark of the parsing, query and plotting paths of advisor.py
+#
+# Synthetic reports with the column layout of a real Advisor report are
+# generated for each size, then every stage is timed (best of several
+# repeats) and its peak memory is measured with tracemalloc. The query
+# stages run on a fresh copy of the parsed report each time, so that they
+# don't reuse the caches or the order left by earlier calls. The results
+# are saved as json so that they can be compared between commits:
+#
+#   python run_benchmark.py --sizes 1000 10000 --output new.json --compare old.json
+#
+# ____________________________________________________________________
+
+import argparse
+import contextlib
+import csv
+import json
+import operator
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import advisor
+
+template_fn = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','csv_advisor_reports','Picsar_PIC_example.csv')
+
+def generate_report(fn,nloops,template=template_fn,seed=0):
+    """
+    Write a synthetic advisor report with about nloops rows to fn. Loops and their children are
+    copies of the records of the template report, moved to new locations and with their times,
+    GFLOPS and AI scaled by random factors.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    reader = advisor.report_reader(template)
+    records = list(reader)
+    keys = reader.keys
+    with open(template,mode='r') as fh:
+        header = [row for row in csv.reader(fh) if len(row) > 0 and row[0].find('ID') >= 0][0]
+
+    col = dict((key,j) for j,key in enumerate(keys))
+    scaled = [col[key] for key in ['self time','total time','elapsed time','gflops','ai','gflop'] if key in col]
+    locations = [col[key] for key in ['location','source location'] if key in col]
+
+    nrows = 0
+    loop_id = 0
+    with open(fn,mode='w',newline='') as fh:
+        writer = csv.writer(fh,quoting=csv.QUOTE_ALL)
+        for row in reader.preamble:
+            writer.writerow(row)
+        writer.writerow(header)
+
+        while nrows < nloops:
+            record = records[rng.randint(len(records))]
+            subroutine = 'kernel_{0}'.format(rng.randint(nloops))
+            file = 'module_{0}.F90'.format(rng.randint(max(1,nloops//50)))
+            line = rng.randint(1,20000)
+            factor = rng.lognormal(0.0,1.0)
+
+            for row in record:
+                row = list(row)
+                depth = advisor.child_depth(row[1])
+                row[0] = str(loop_id)
+                row[1] = '[child]-' * depth + '[loop in {0} at {1}:{2}]'.format(subroutine,file,line)
+                for j in scaled:
+                    row[j] = scale_cell(row[j],factor)
+                for j in locations:
+                    row[j] = '{0}:{1}'.format(file,line)
+                writer.writerow(row)
+                loop_id += 1
+                nrows += 1
+
+    return nrows
+
+def scale_cell(cell,factor):
+    """
+    Multiply the number in cell by factor, keeping a trailing unit
+    """
+    unit = cell[-1:] if cell[-1:] in ['s','x'] else ''
+    try:
+        value = float(cell[:len(cell)-len(unit)])
+    except ValueError:
+        return cell
+    return '{0:.4f}{1}'.format(value * factor,unit)
+
+def run_stage(func,setup=None,repeat=5,memory=True):
+    """
+    Time func repeat times and, if memory is True, run it once more under tracemalloc to measure its
+    peak memory. With setup, every call is func(setup()) on a new object, and setup is not measured.
+    Return the best time in seconds, the peak bytes (None if not measured) and the result of the last
+    timed call.
+    """
+
+    state = dict()
+
+    def prepare():
+        state['args'] = () if setup is None else (setup(),)
+
+    def call():
+        state['result'] = func(*state['args'])
+
+    seconds = min(timeit.repeat(call,setup=prepare,repeat=repeat,number=1))
+
+    peak = None
+    if memory:
+        prepare()
+        tracemalloc.start()
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return seconds,peak,state['result']
+
+def benchmark(fn,nrows,memory=True,repeat=5):
+    """
+    Time all the stages on the report fn. Return a dictionary of stage name -> results.
+    """
+
+    stages = dict()
+
+    def record(name,func,setup=None):
+        seconds,peak,result = run_stage(func,setup=setup,repeat=repeat,memory=memory)
+        stages[name] = {'seconds':seconds,
+                        'rows_per_second':nrows / seconds if seconds > 0 else None,
+                        'peak_bytes':peak}
+        print(' {0:24} {1:10.4f} s {2:14.0f} rows/s {3:>14} bytes'.format(
+            name,seconds,stages[name]['rows_per_second'] or 0,'-' if peak is None else peak))
+        return result
+
+    adv = record('parse',lambda: advisor.advisor_results(fn,cache=False))
+    record('write_cache',adv.write_cache)
+    record('load_cache',lambda: advisor.advisor_results(fn))
+
+    # Copy of the parsed report without any cached column, sort order or typed values, in memory
+    arrays,info = adv.encode()
+    fresh = lambda: advisor.advisor_results.decode(arrays,info)
+
+    files = adv.store.get_raw('file')
+    file = files[len(files)//2]
+    record('get_array',lambda adv: adv.get_array('ai'),fresh)
+    record('get_array_filterop',lambda adv: adv.get_array('ai',filterVal=[file],filterKey=['file'],filterOp=[operator.eq]),fresh)
+    record('get_array_where',lambda adv: adv.get_array('ai',where=advisor.condition(file=file,selftime__gt=0.01)),fresh)
+    record('get_sum',lambda adv: adv.get_sum('self time'),fresh)
+    record('parse_locations',lambda adv: adv.get_locations(),fresh)
+    record('get_typed',lambda adv: [adv.store.get_typed(key) for key in ['selftime','gflop','datatypes'] if adv.store.has_key(key)],fresh)
+    record('group_by',lambda adv: adv.group_by('file'),fresh)
+    record('top',lambda adv: adv.top(20,by='file'),fresh)
+    record('sort',lambda adv: adv.sort('file'),fresh)
+    record('argsort',lambda adv: adv.argsort(['file','selftime'],descending=[False,True]),fresh)
+
+    def print_loops(adv):
+        with open(os.devnull,mode='w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                adv.print_loop_properties(include_children=True,has_data=True)
+    record('print_loop_properties',print_loops,fresh)
+    record('print_loop_properties_csv',lambda adv: adv.print_loop_properties(include_children=True,has_data=True,
+                                                                              output=os.devnull,fmt='csv'),fresh)
+
+    def plot(adv):
+        adv.plot(fignum=1,sizeKey='selftime',colorKey='gainestimate',tooltips=False)
+        plt.close('all')
+    record('plot',plot,fresh)
+
+    def plot_dense(adv):
+        adv.plot(fignum=1,sizeKey='selftime',colorKey='gainestimate',tooltips=False,dense=True)
+        plt.close('all')
+    record('plot_dense',plot_dense,fresh)
+
+    return stages
+
+def git_commit():
+    """
+    Return the current git commit of the repository, or None
+    """
+    try:
+        out = subprocess.run(['git','rev-parse','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True,text=True,check=True)
+        return out.stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def compare(results,reference):
+    """
+    Print the ratio of the times of results to the times of reference for the sizes and stages in both
+    """
+    print()
+    print(' Time ratio to {0}'.format(reference.get('commit')))
+    for size,stages in results['sizes'].items():
+        if not size in reference['sizes']:
+            continue
+        print(' {0} loops'.format(size))
+        for name,stage in stages.items():
+            ref = reference['sizes'][size].get(name)
+            if ref is None or ref['seconds'] == 0:
+                continue
+            print(' {0:24} {1:8.2f}x'.format(name,stage['seconds'] / ref['seconds']))
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark of advisor.py on synthetic reports')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[1000,10000,100000],
+                        help='numbers of loops of the synthetic reports (up to 1000000)')
+    parser.add_argument('--output',default='benchmark.json',help='json file for the results')
+    parser.add_argument('--compare',default=None,help='json file of a previous run to compare with')
+    parser.add_argument('--template',default=template_fn,help='advisor report used as template')
+    parser.add_argument('--repeat',type=int,default=5,help='number of timed calls of each stage, the best one is kept')
+    parser.add_argument('--no-memory',action='store_true',help='do not measure the peak memory')
+    parser.add_argument('--workdir',default=None,help='directory for the synthetic reports (default: temporary)')
+    args = parser.parse_args(argv)
+
+    results = {'commit':git_commit(),
+               'date':time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python':platform.python_version(),
+               'numpy':np.__version__,
+               'machine':platform.machine(),
+               'repeat':args.repeat,
+               'sizes':dict()}
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for size in args.sizes:
+            fn = os.path.join(workdir,'synthetic_{0}.csv'.format(size))
+            nrows = generate_report(fn,size,template=args.template)
+            print()
+            print(' {0} loops, {1:.1f} MB'.format(nrows,os.path.getsize(fn) / 1e6))
+            results['sizes'][str(size)] = benchmark(fn,nrows,memory=not args.no_memory,repeat=args.repeat)
+
+    with open(args.output,mode='w') as fh:
+        json.dump(results,fh,indent=1)
+    print()
+    print(' Results written to '+args.output)
+
+    if not args.compare is None:
+        with open(args.compare,mode='r') as fh:
+            compare(results,json.load(fh))
+
+if __name__ == '__main__':
+    main()
@@ -56,3 +56,637 @@ else:
         print("GFLOPS values do not match with reference values")
     if(not all(times == times_ref_values)):
         print("time values do not match with reference values")
+
+# 3. Test the declarative filters
+
+print("Testing filter conditions")
+
+rows = adv.where(file='current_deposition.F90',line__in=[2681,2730,9552])
+ai = adv.get_values('ai',rows)
+gflops = adv.get_values('gflops',rows)
+times = adv.get_array('selftime',where=advisor.condition(file='current_deposition.F90',line__in=[2681,2730,9552]))
+
+if ( all(ai == ai_ref_values) and
+     all(gflops == gflops_ref_values) and
+     all(times == times_ref_values) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Filter conditions do not match with reference values")
+
+# 4. Test matching the loops of two reports
+
+print("Testing report diff")
+
+d = advisor.diff(adv,adv)
+
+if ( len(d.rows1) == adv.store.nrows and
+     all(d.rows1 == d.rows2) and
+     all(d.get_delta('selftime') == 0) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Loops of a report are not matched with themselves")
+
+# Children take the gain estimate of their parent loop
+adv1 = advisor.advisor_results('../csv_advisor_reports/advisor.csv')
+adv2 = advisor.advisor_results('../csv_advisor_reports/advisor2.csv')
+d = advisor.diff(adv1,adv2)
+children = adv1.tree.is_child[d.rows1] & d.has_data
+parents1 = adv1.get_floats('gainestimate',adv1.tree.top[d.rows1[children]])
+parents2 = adv2.get_floats('gainestimate',adv2.tree.top[d.rows2[children]])
+known = np.isfinite(parents1) & np.isfinite(parents2)
+
+if ( children.any() and known.any() and
+     all(np.isfinite(d.delta['gainestimate'][children][known])) and
+     np.array_equal(d.delta['gainestimate'][children],parents2 - parents1,equal_nan=True) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Gain estimates of matched child loops are not the ones of their parents")
+
+# 5. Test the history database
+
+print("Testing history database")
+
+import advisor_history
+
+db = advisor_history.history(':memory:')
+db.ingest(adv,'run1',date='2017-01-01')
+db.ingest(adv,'run2',date='2017-01-02')
+tags,dates,values = db.get_series('selftime','particles_push.F90',1295,last=1)
+
+if ( list(tags) == ['run2'] and
+     all(values == [0.6199]) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Self time of particles_push.F90:1295 not found in the history")
+db.close()
+
+# 6. Test the tooltip index of the plots
+
+print("Testing tooltip index")
+
+rows = adv.get_rows()
+x = adv.get_floats('ai',rows)
+y = adv.get_floats('gflops',rows)
+index = advisor.point_index(x,y)
+found = [index.query(x[i]*1.01,y[i],x[i]*1.1,y[i]*1.1) for i in range(len(rows))]
+
+if ( all(x[found] == x) and
+     all(y[found] == y) and
+     index.query(1.0e5,1.0e5,2.0e5,2.0e5) == -1 ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Loops are not found next to their own coordinates")
+
+# 7. Test the aggregation of the loops
+
+print("Testing aggregation")
+
+totals = adv.group_by(keys=['selftime'])
+files = adv.top(by='file',share=0.9)
+loops = adv.top(3)
+
+if ( abs(totals['selftime'][0] - 3.0972) < 1e-9 and
+     list(files['groups'][:2]) == ['particles_push.F90','current_deposition.F90'] and
+     files['cumulative'][-1] >= 0.9 and files['cumulative'][-2] < 0.9 and
+     all(loops['selftime'] == [0.6199,0.4738,0.3624]) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Aggregated self times do not match with reference values")
+
+# 8. Test sorting by several keys
+
+print("Testing sorting")
+
+order = [loop._row for loop in adv.loops]
+rows = adv.argsort(['file','selftime'],descending=[False,True])
+times = adv.get_floats('selftime',rows[adv.get_values('file',rows) == 'particles_push.F90'],0.0)
+
+if ( [loop._row for loop in adv.loops] == order and
+     adv.argsort(['file','selftime'],descending=[False,True]) is rows and
+     all(times[:-1] >= times[1:]) and
+     all(adv.get_values('selftime',adv.argsort('selftime',descending=True)[:3]) == [0.6199,0.4738,0.3624]) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Loops are not sorted by file and self time")
+
+# 9. Test the table of loops
+
+print("Testing loop table")
+
+import io
+
+fh = io.StringIO()
+table = adv.print_loop_properties(include_children=True,has_data=True,output=fh,fmt='csv')
+lines = fh.getvalue().splitlines()
+
+if ( len(lines) == len(table) + 1 and
+     len(set(table.rows.tolist())) == len(table) and
+     lines[0] == 'type,id,subroutine,file,line,AI,gflops,time' ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Loops are not written once each")
+
+# Children of children are listed after their parent
+
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    nested_fn = os.path.join(tmpdir,'nested.csv')
+    with open(fn,mode='r') as fh:
+        lines = fh.readlines()
+    child = [i for i,line in enumerate(lines) if '"[child]-[loop' in line and '"0.6199s"' in line][0]
+    lines.insert(child+1,lines[child].replace('"[child]-','"[child]-[child]-').replace('0.6199s','0.1234s'))
+    with open(nested_fn,mode='w') as fh:
+        fh.writelines(lines)
+    adv_nested = advisor.advisor_results(nested_fn,cache=False)
+
+nested_table = adv_nested.loop_table(include_children=True,has_data=True)[0]
+nested = np.flatnonzero(adv_nested.tree.depth == 2)
+position = list(nested_table.rows).index(nested[0]) if len(nested) == 1 and nested[0] in nested_table.rows else -1
+
+if ( len(nested_table) == len(table) + 1 and
+     position > 0 and nested_table.rows[position-1] == adv_nested.tree.parent[nested[0]] and
+     adv_nested.store.get_raw('self time',nested)[0] == '0.1234s' ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Children of children are not listed after their parent")
+
+# 10. Test the typed columns
+
+print("Testing typed columns")
+
+rows = adv.where(file='particles_push.F90',line=1295)
+times = adv.get_typed('selftime',rows)
+gflop = adv.get_typed('gflop')
+bounds = gflop['flags'] & advisor.flag_bound > 0
+vl = adv.get_typed('vlvectorlength')
+pairs = adv.store.get_raw('vlvectorlength') == '8; [8]'
+
+# Cells with a trailing dot are not numbers
+import os
+import tempfile
+
+malformed = ['1.5.','1.5.s','3.2.']
+with tempfile.TemporaryDirectory() as tmpdir:
+    malformed_fn = os.path.join(tmpdir,'malformed.csv')
+    with open(fn,mode='r') as fh:
+        text = fh.read()
+    with open(malformed_fn,mode='w') as fh:
+        fh.write(text.replace('0.6199s',malformed[1],1))
+    adv_malformed = advisor.advisor_results(malformed_fn,cache=False)
+    malformed_rows = np.flatnonzero(adv_malformed.store.get_raw('self time') == malformed[1])
+    malformed_typed = adv_malformed.get_typed('selftime',malformed_rows)
+
+if ( times['values'][0] == 0.6199 and
+     bounds.any() and all(gflop['values'][bounds] == 0.0001) and
+     pairs.any() and all(vl['values'][pairs] == 8) and all(vl['remainder'][pairs] == 8) and
+     all(advisor.convert_to_float(cell) is None for cell in malformed) and
+     all(advisor.parse_cell(cell,'time')['flags'] & advisor.flag_invalid for cell in malformed) and
+     len(malformed_rows) == 1 and malformed_typed['flags'][0] & advisor.flag_invalid ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Typed values do not match with the cells")
+
+# Bounds, pairs and percentages are values of the filters and of get_array
+
+rows = adv.where()
+bounded = adv.where(gflop__le=0.0001)
+expected = rows[adv.get_typed('gflop',rows)['values'] <= 0.0001]
+vl_values,vl_valid = adv.store.get_float('vlvectorlength')
+duration = adv.get_array('tripcountsiterationduration',include_children=True,where=advisor.condition(gflop__le=0.0001))
+
+if ( len(bounded) > 0 and all(bounded == expected) and
+     any(adv.get_typed('gflop',bounded)['flags'] & advisor.flag_bound) and
+     all(vl_valid[pairs]) and all(vl_values[pairs] == 8) and
+     '0.0001' in list(duration) and not any(str(cell).startswith('<') for cell in duration) and
+     advisor.convert_cell('48.2%','percent') == 48.2 and
+     advisor.convert_cell('<b>Float64</b>; Int32','list') is None ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Filters do not use the typed values")
+
+# 11. Test the categorical columns
+
+print("Testing categorical columns")
+
+codes,vocab = adv.store.get_codes('file')
+mask = adv.store.code_mask('file',set(['current_deposition.F90']))
+
+if ( not codes is None and
+     adv.store.raw[adv.store.index['file']] is None and
+     all(vocab[codes] == adv.store.get_raw('file')) and
+     all(adv.data['file'] == adv.store.get_raw('file')) and
+     adv.loops[0].file == vocab[codes[adv.loops[0]._row]] and
+     all(mask == (adv.store.get_raw('file') == 'current_deposition.F90')) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Codes of the file column do not match with the cells")
+
+# 12. Test the Arrow and Parquet files
+
+print("Testing Arrow and Parquet files")
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+if pyarrow is None:
+    print("Skipped, pyarrow is not installed")
+else:
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        same = True
+        for name in ['report.arrow','report.parquet']:
+            adv.write_arrow(os.path.join(tmpdir,name))
+            adv2 = advisor.advisor_results.read_arrow(os.path.join(tmpdir,name))
+            ai = adv2.get_array('ai',where=advisor.condition(file='current_deposition.F90',line__in=[2681,2730,9552]))
+            same = same and all(ai == ai_ref_values) and all(adv2.tree.parent == adv.tree.parent)
+
+    if same:
+        print("Passed")
+    else:
+        print("Tests failed")
+        print("Reports read from Arrow and Parquet files do not match with reference values")
+
+# 13. Test the alignment of the reports of several MPI ranks
+
+print("Testing MPI ranks")
+
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    paths = list()
+    with open(fn,mode='r') as fh:
+        text = fh.read()
+    for rank in [1,0]:
+        paths.append(os.path.join(tmpdir,'rank{0}.csv'.format(rank)))
+        with open(paths[-1],mode='w') as fh:
+            fh.write(text.replace('MPI rank:0','MPI rank:{0}'.format(rank)))
+    ranks = advisor.load_ranks(paths,workers=1,cache=False)
+
+mn,mean,mx,imbalance = ranks.get_stats('selftime')
+
+if ( adv.rank == 0 and
+     list(ranks.ranks) == [0,1] and
+     ranks.values['selftime'].shape == (2,adv.store.nrows) and
+     all(mn == mx) and all(imbalance[mean > 0] == 0) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Loops of identical ranks are not aligned")
+
+# 14. Test the bulk parsing of the function call sites and loops column
+
+print("Testing location parsing")
+
+labels = ['[loop in push_$omp$parallel_for@55 at push.F90:84]',
+          '[child]-[child]-[loop in push_$omp$parallel_for@55 at push.F90:84]',
+          '[loop in func@0x4060d0]',
+          'main at main.c:12',
+          '[loop in broken at push.F90]']
+locations = advisor.parse_locations(labels)
+single = [vals for label in labels for vals in [adv.parse_functioncallsitesandloops(label,list(),list())[0]]]
+
+if ( list(locations['child']) == [False,True,False,False,False] and
+     list(locations['subroutine']) == ['push_$omp$parallel_for@55','push_$omp$parallel_for@55','None','main','None'] and
+     list(locations['line']) == [84,84,0,12,0] and
+     list(locations['kind']) == ['loop','loop','loop','function','loop'] and
+     locations['region'][0] == 'parallel_for@55' and
+     list(locations['malformed']) == [False,False,False,False,True] and
+     [vals[1] for vals in single] == list(locations['subroutine']) and
+     len(adv.malformed_locations()) == 0 ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Parsed locations do not match with reference values")
+
+# 15. Test the query server and its client
+
+print("Testing query server")
+
+import os
+import advisor_server
+
+server = advisor_server.query_server(cache=False)
+(host,port),stop = server.run_in_thread()
+try:
+    client = advisor_server.advisor_client(fn,port=port)
+    cond = advisor.condition(file='current_deposition.F90',line__in=[2681,2730,9552])
+    ai = client.get_array('ai',where=cond)
+    ai_again = client.get_array('ai',where=cond)
+    listing = list(client.loops(keys=['selftime'],where=cond))
+    top = client.top(3,by='file')
+    client.close()
+finally:
+    stop()
+
+if ( all(ai == ai_ref_values) and
+     all(ai_again == ai_ref_values) and
+     [loop['selftime'] for loop in listing] == times_ref_values and
+     list(top['groups']) == list(adv.top(3,by='file')['groups']) and
+     server.reports.misses == 1 ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Query server results do not match with reference values")
+
+# Roofs files outside of the root are refused, and a streamed query failing after its first chunk
+# closes the connection instead of writing an error into the body
+
+import http.client
+
+def query_failing(adv,args):
+    yield {'keys':['selftime']}
+    yield [[0,0.3624]]
+    raise ValueError('failed after the first chunk')
+
+advisor_server.queries['failing'] = query_failing
+advisor_server.streamed.append('failing')
+
+server = advisor_server.query_server(cache=False,root=os.path.dirname(fn))
+(host,port),stop = server.run_in_thread()
+try:
+    client = advisor_server.advisor_client(os.path.basename(fn),port=port)
+    try:
+        client.roofline(roofs=os.path.abspath(advisor.__file__))
+        refused = False
+    except RuntimeError as err:
+        refused = str(err).startswith('403')
+    try:
+        client._request('POST','/query/failing',{}).read()
+        partial = None
+    except http.client.IncompleteRead as err:
+        partial = err.partial
+    client.close()
+finally:
+    stop()
+    del advisor_server.queries['failing']
+    advisor_server.streamed.remove('failing')
+
+if ( refused and
+     partial == b'{"keys":["selftime"]}\n[0,0.3624]\n' ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Query server does not refuse the roofs file or does not abort the failed stream")
+
+# 16. Test the instrumentation of the stages
+
+print("Testing instrumentation")
+
+import io
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    trace = os.path.join(tmpdir,'trace.json')
+    with advisor.instrumentation(memory=True,trace=trace) as prof:
+        adv_instrumented = advisor.advisor_results(fn,cache=False)
+        ai = adv_instrumented.get_array('ai',include_children=True,filterVal=['current_deposition.F90',[2681,2730,9552]],
+                                        filterKey=['file','line'],filterOp=[op1,op2])
+        adv_instrumented.print_loop_properties(output=io.StringIO())
+    traced = os.path.exists(trace)
+
+stages = prof.stages
+if ( all(ai == ai_ref_values) and
+     traced and
+     advisor.active_instrumentation is None and
+     stages['advisor_results']['rows'] == adv.store.nrows and
+     stages['advisor_results/parse/read']['calls'] == 1 and
+     stages['get_array']['rows'] == len(ai_ref_values) and
+     'peak' in stages['print_loop_properties'] and
+     prof.counters['failed_float_conversions'] > 0 ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Instrumentation does not record the expected stages")
+
+# 17. Test the import time of the module, matplotlib is only imported by the plots
+
+print("Testing import time")
+
+import subprocess
+import sys
+
+# Seconds allowed for import advisor, not counting numpy
+import_budget = 0.25
+
+out = subprocess.run([sys.executable,'-c',
+                      'import sys,time\n'
+                      'import numpy\n'
+                      'start = time.perf_counter()\n'
+                      'import advisor\n'
+                      'print(time.perf_counter() - start,"matplotlib" in sys.modules)'],
+                     cwd=os.path.dirname(os.path.abspath(advisor.__file__)),capture_output=True,text=True)
+seconds,plotting = out.stdout.split()
+
+if ( float(seconds) < import_budget and
+     plotting == 'False' ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("import advisor took {0} s (budget {1} s), matplotlib imported: {2}".format(seconds,import_budget,plotting))
+
+# 18. Test the binary cache of the reports
+
+print("Testing report cache")
+
+import json
+import os
+import shutil
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    cached_fn = os.path.join(tmpdir,'report.csv')
+    shutil.copy(fn,cached_fn)
+    selftime = adv.get_array('selftime')
+
+    # Written on the first load, read on the next ones
+    advisor.advisor_results(cached_fn)
+    written = os.path.exists(os.path.join(cached_fn+'.pyadvisor','meta.json'))
+    adv_cached = advisor.advisor_results(cached_fn)
+    hit = adv_cached.read_cache() and all(adv_cached.get_array('selftime') == selftime)
+
+    # A new modification time with the same content keeps the cache
+    stat = os.stat(cached_fn)
+    os.utime(cached_fn,(stat.st_atime,stat.st_mtime + 10))
+    touched = adv_cached.read_cache()
+
+    # Same size, different content
+    with open(cached_fn,mode='r') as fh:
+        text = fh.read()
+    with open(cached_fn,mode='w') as fh:
+        fh.write(text.replace('0.6199s','0.6198s',1))
+    os.utime(cached_fn,(stat.st_atime,stat.st_mtime + 20))
+    changed_content = not adv_cached.read_cache()
+
+    # Rewriting the cache doesn't change the reports already loaded from it
+    adv_new = advisor.advisor_results(cached_fn)
+    kept = ( all(adv_cached.get_array('selftime') == selftime) and
+             abs(adv_cached.get_sum('self time') - adv_new.get_sum('self time') - 0.0001) < 1e-9 )
+
+    # Different size
+    with open(cached_fn,mode='a') as fh:
+        fh.write('\n')
+    changed_size = not adv_new.read_cache()
+
+    # meta.json with missing fields, or not an object, is a miss and the report is parsed again
+    broken_fn = os.path.join(tmpdir,'broken.csv')
+    shutil.copy(fn,broken_fn)
+    adv_broken = advisor.advisor_results(broken_fn)
+    meta_fn = os.path.join(broken_fn+'.pyadvisor','meta.json')
+    with open(meta_fn,mode='r') as fh:
+        meta = json.load(fh)
+    del meta['keys']
+    broken = list()
+    for contents in [meta,[meta['version']],{}]:
+        with open(meta_fn,mode='w') as fh:
+            json.dump(contents,fh)
+        broken.append(not adv_broken.read_cache())
+    broken = all(broken) and all(advisor.advisor_results(broken_fn).get_array('selftime') == selftime)
+
+    # No cache
+    uncached_fn = os.path.join(tmpdir,'uncached.csv')
+    shutil.copy(fn,uncached_fn)
+    advisor.advisor_results(uncached_fn,cache=False)
+    uncached = not os.path.exists(uncached_fn+'.pyadvisor')
+
+if written and hit and touched and changed_content and kept and changed_size and broken and uncached:
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Cache: written {0}, hit {1}, touched {2}, content change {3}, kept {4}, size change {5}, broken {6}, uncached {7}".format(
+        written,hit,touched,changed_content,kept,changed_size,broken,uncached))
+
+# 19. Test the roofs file and the roofline model
+
+print("Testing roofline model")
+
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    roofs_fn = os.path.join(tmpdir,'roofs.dat')
+    with open(roofs_fn,mode='w') as fh:
+        fh.write('DRAM Bandwidth memory 20 GB/s\n'
+                 'L1 Bandwidth memory 200000000000 B/s\n'
+                 'DRAM Bandwidth (single-threaded) memory 5 GB/s\n'
+                 'Scalar Add Peak compute 50 GFLOPS\n'
+                 'DP Vector Add Peak compute 0.5 TFLOP/s\n'
+                 'DP Vector FMA Peak compute 1000 GFLOPS\n'
+                 'Total time 12.5 s\n')
+    ceilings = advisor.read_roofs(roofs_fn)
+
+model = advisor.roofs(ceilings=ceilings).model()
+# Loops under the DRAM roof, under the scalar peak, above every roof and at an intensity where
+# the memory roofs are above the highest peak
+roof,ceiling,percent = model.classify([1.0,1.0,100.0,100.0,np.nan],[10.0,30.0,2000.0,700.0,1.0])
+curves = model.curves([1.0,100.0],bandwidths=['drambandwidth'],peaks=['scalaraddpeak','dpvectorfmapeak'])
+
+if ( ceilings['single'] == {'drambandwidth':5.0} and
+     ceilings['multi'] == {'drambandwidth':20.0,'l1bandwidth':200.0,'scalaraddpeak':50.0,
+                           'dpvectoraddpeak':500.0,'dpvectorfmapeak':1000.0} and
+     [model.names[r] for r in roof[:4]] == ['drambandwidth','scalaraddpeak','dpvectorfmapeak','dpvectorfmapeak'] and
+     roof[4] == -1 and
+     all(ceiling[:4] == [20.0,50.0,1000.0,1000.0]) and
+     all(percent[:4] == [50.0,60.0,200.0,70.0]) and
+     np.array_equal(curves,[[20.0,50.0],[20.0,1000.0]]) ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Roofline model does not match with reference values")
+
+# 20. Test reading several reports in worker processes
+
+print("Testing parallel loading")
+
+import os
+import subprocess
+import sys
+
+# The pool is started in a separate interpreter, so that the workers don't import this script
+# where new processes are spawned rather than forked
+out = subprocess.run([sys.executable,'-c',
+                      'import numpy as np\n'
+                      'import advisor\n'
+                      'paths = ["../csv_advisor_reports/Picsar_PIC_example.csv","../csv_advisor_reports/advisor.csv",\n'
+                      '         "../csv_advisor_reports/advisor2.csv"]\n'
+                      'serial = [advisor.advisor_results(fn,cache=False) for fn in paths]\n'
+                      'parallel = advisor.advisor_results.load_many(paths,workers=2,cache=False)\n'
+                      'combined = advisor.advisor_results.load_many(paths,workers=2,cache=False,combine=True)\n'
+                      '# A single worker reads the reports in this process, without encoding them\n'
+                      'advisor.advisor_results.encode = None\n'
+                      'single = advisor.advisor_results.load_many(paths,workers=1,cache=False)\n'
+                      'print(all(p.store.keys == s.store.keys and\n'
+                      '          all(np.array_equal(p.store.get_raw(key),s.store.get_raw(key)) for key in s.store.keys) and\n'
+                      '          np.array_equal(p.tree.parent,s.tree.parent) and\n'
+                      '          np.array_equal(p.get_array("selftime"),s.get_array("selftime"))\n'
+                      '          for p,s in zip(parallel,serial)),\n'
+                      '      combined.nrows == sum(s.store.nrows for s in serial) and\n'
+                      '      list(combined.get_raw("report")) == [fn for fn,s in zip(paths,serial) for row in range(s.store.nrows)] and\n'
+                      '      np.array_equal(combined.get_raw("self time"),np.concatenate([s.store.get_raw("self time") for s in serial])),\n'
+                      '      [s.filename for s in single] == paths and\n'
+                      '      all(np.array_equal(p.get_array("selftime"),s.get_array("selftime")) for p,s in zip(single,serial)))'],
+                     cwd=os.path.dirname(os.path.abspath(advisor.__file__)),capture_output=True,text=True)
+loaded = out.stdout.split()
+
+if loaded == ['True','True','True']:
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Reports read in parallel do not match with the serial ones: {0}".format(out.stdout + out.stderr))
+
+# 21. Test the batch rendering of the roofline plots
+
+print("Testing batch rendering")
+
+import os
+import tempfile
+
+import matplotlib
+import advisor_batch
+
+# The backend of the calling process is not changed
+backend = matplotlib.get_backend()
+matplotlib.use('svg')
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    missing_fn = os.path.join(tmpdir,'missing.csv')
+    specs = [{'report':fn,'name':'picsar','title':'Picsar'},
+             {'report':missing_fn,'name':'missing','title':'Missing'}]
+    results = advisor_batch.render_reports(specs,os.path.join(tmpdir,'figures'),workers=1,cache=False)
+    images = sorted(os.listdir(os.path.join(tmpdir,'figures')))
+    with open(os.path.join(tmpdir,'figures','index.html'),mode='r') as fh:
+        page = fh.read()
+
+kept_backend = matplotlib.get_backend() == 'svg'
+matplotlib.use(backend)
+
+rendered,failed = results
+if ( images == ['index.html','picsar.png'] and
+     rendered['image'] == 'picsar.png' and rendered['error'] is None and rendered['loops'] > 0 and
+     failed['image'] is None and failed['error'].startswith('FileNotFoundError') and
+     '<img src="picsar.png"' in page and
+     '<td>Missing</td>' in page and '<pre>FileNotFoundError' in page and
+     kept_backend ):
+    print("Passed")
+else:
+    print("Tests failed")
+    print("Batch rendering does not write the expected images and index page: {0}".format(results))